@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from backendinterface import McstBackendInterface
+from dirinfo import McServerDirectoryInfo
+
+
+DEFAULT_TTL = 60.0
+DEFAULT_MAX_ENTRIES = 256
+
+
+class McstBackendCache(McstBackendInterface):
+    def __init__(self, backend: McstBackendInterface, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, clock: Callable[[], float] = time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, key: tuple, loader: Callable, *args, expires: bool = True):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                deadline, value = entry
+                if deadline is None or deadline > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+        value = loader(*args)
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl if expires else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, name: Optional[str] = None):
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key[0] == "list" or key[1:] == (name,)]:
+                    del self.entries[key]
+        self.backend.invalidate(name)
+
+    def watch(self, on_event: Callable[[dict], None]):
+        def invalidating(event: dict):
+            self.invalidate(event["name"])
+            on_event(event)
+        self.backend.watch(invalidating)
+
+    def unwatch(self):
+        self.backend.unwatch()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+    def list(self) -> List[str]:
+        return list(self.cached(("list",), self.backend.list))
+
+    def list_page(self, offset: int, limit: int, match: str = "") -> dict:
+        return dict(self.cached(("list", offset, limit, match), self.backend.list_page, offset, limit, match))
+
+    def settings_dump(self, name: str) -> str:
+        return self.cached(("settings", name), self.backend.settings_dump, name)
+
+    def settings_replace(self, name: str, new_content: str):
+        try:
+            self.backend.settings_replace(name, new_content)
+        finally:
+            self.invalidate(name)
+
+    def settings_get(self, name: str, keys: List[str]) -> Dict[str, str]:
+        return self.backend.settings_get(name, keys)
+
+    def settings_patch(self, names: List[str], changes: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+        try:
+            return self.backend.settings_patch(names, changes)
+        finally:
+            for name in names:
+                self.invalidate(name)
+
+    def load_info(self, name: str) -> McServerDirectoryInfo:
+        return self.cached(("info", name), self.backend.load_info, name)
+
+    def start(self, name: str, port: str, version: str):
+        try:
+            self.backend.start(name, port, version)
+        finally:
+            self.invalidate(name)
+
+    def create(self, name: str):
+        try:
+            self.backend.create(name)
+        finally:
+            self.invalidate(name)
+
+    def clone(self, name: str, template: str):
+        try:
+            self.backend.clone(name, template)
+        finally:
+            self.invalidate(name)
+
+    def health(self) -> Dict[str, dict]:
+        # Probing is the point, a cached answer would hide a server going down
+        return self.backend.health()
+
+    def list_versions(self) -> List[str]:
+        return list(self.cached(("versions",), self.backend.list_versions, expires=False))
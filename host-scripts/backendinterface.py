@@ -1,15 +1,35 @@
+import json
 import os
+import struct
+import subprocess
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 
 from dirinfo import McServerDirectoryInfo
 
 
+FRAME_HEADER = struct.Struct("!I")
+WATCH_INITIAL_BACKOFF = 1.0
+WATCH_MAX_BACKOFF = 60.0
+WATCH_STABLE_RUNTIME = 60.0
+REMOTE_ERRORS = {
+    "FileNotFoundError": FileNotFoundError,
+    "FileExistsError": FileExistsError,
+    "ValueError": ValueError,
+}
+
+
 class McstBackendInterface(ABC):
     @abstractmethod
     def list(self) -> List[str]:
         pass
 
+    @abstractmethod
+    def list_page(self, offset: int, limit: int, match: str = "") -> dict:
+        pass
+
     @abstractmethod
     def settings_dump(self, name: str) -> str:
         pass
@@ -18,6 +38,14 @@ class McstBackendInterface(ABC):
     def settings_replace(self, name: str, new_content: str):
         pass
 
+    @abstractmethod
+    def settings_get(self, name: str, keys: List[str]) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def settings_patch(self, names: List[str], changes: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+        pass
+
     @abstractmethod
     def load_info(self, name: str) -> McServerDirectoryInfo:
         pass
@@ -38,15 +66,36 @@ class McstBackendInterface(ABC):
     def list_versions(self) -> List[str]:
         pass
 
+    @abstractmethod
+    def health(self) -> Dict[str, dict]:
+        pass
+
+    def invalidate(self, name: Optional[str] = None):
+        pass
+
+    def watch(self, on_event: Callable[[dict], None]):
+        pass
+
+    def unwatch(self):
+        pass
+
 
 class McstBackend(McstBackendInterface):
     def __init__(self):
         self.command_template = "~/bin/mcst.sh"
+        self.watch_process = None
+        self.watch_stopped = None
+        self.watch_lock = threading.Lock()
 
     def list(self) -> List[str]:
         output = os.popen(f"{self.command_template} list").read()
         return [name for name in output.split("\n") if name]
 
+    def list_page(self, offset: int, limit: int, match: str = "") -> dict:
+        arguments = f'--json --offset {offset} --limit {limit} --match "{match}"'
+        output = os.popen(f"{self.command_template} list {arguments}").read()
+        return json.loads(output)
+
     def create(self, name: str):
         os.system(f'{self.command_template} create "{name}"')
 
@@ -55,15 +104,27 @@ class McstBackend(McstBackendInterface):
         return output
 
     def settings_replace(self, name: str, new_content: str):
-        pipe = os.popen(f'{self.command_template} settings-replace "{name}"', mode="w")
-        pipe.write(new_content)
+        # Closing the pipe waits for the command, the settings are written when this returns
+        with os.popen(f'{self.command_template} settings-replace "{name}"', mode="w") as pipe:
+            pipe.write(new_content)
+
+    def settings_get(self, name: str, keys: List[str]) -> Dict[str, str]:
+        quoted_keys = " ".join(f'"{key}"' for key in keys)
+        output = os.popen(f'{self.command_template} settings-get --json "{name}" {quoted_keys}').read()
+        return json.loads(output)
+
+    def settings_patch(self, names: List[str], changes: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+        quoted_names = " ".join(f'"{name}"' for name in names)
+        output = subprocess.run(f"{self.command_template} settings-patch {quoted_names}", shell=True,
+                                input=json.dumps(changes), stdout=subprocess.PIPE, universal_newlines=True).stdout
+        return json.loads(output)
 
     def load_info(self, name: str) -> McServerDirectoryInfo:
         output = os.popen(f'{self.command_template} info "{name}"').read()
         return McServerDirectoryInfo.load(output)
 
     def start(self, name: str, port: str, version: str):
-        os.system(f'{self.command_template} start --port {port} --mcversion {version} "{name}"')
+        os.system(f'{self.command_template} start --detach --port {port} --mcversion {version} "{name}"')
 
     def clone(self, name: str, template: Optional[str]):
         if template is None:
@@ -75,6 +136,153 @@ class McstBackend(McstBackendInterface):
         output = os.popen(f"{self.command_template} list-versions").read()
         return [version for version in output.split("\n") if version]
 
+    def health(self) -> Dict[str, dict]:
+        output = os.popen(f"{self.command_template} health --json").read()
+        return json.loads(output)
+
+    def watch(self, on_event: Callable[[dict], None]):
+        self.unwatch()
+        self.watch_stopped = threading.Event()
+        threading.Thread(target=self.read_events, args=(self.watch_stopped, on_event), daemon=True).start()
+
+    def read_events(self, stopped: threading.Event, on_event: Callable[[dict], None]):
+        backoff = WATCH_INITIAL_BACKOFF
+        while not stopped.is_set():
+            command = os.path.expanduser(self.command_template)
+            # docker exec -i would otherwise read from the terminal of the GUI
+            process = subprocess.Popen([command, "watch"], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       universal_newlines=True)
+            with self.watch_lock:
+                if stopped.is_set():
+                    process.terminate()
+                    process.wait()
+                    return
+                self.watch_process = process
+            started = time.monotonic()
+            try:
+                for line in process.stdout:
+                    on_event(json.loads(line))
+            except ValueError as e:
+                print(f"Watch sent something that is not JSON: {e}")
+                process.terminate()
+            process.wait()
+            if stopped.is_set():
+                return
+            if time.monotonic() - started > WATCH_STABLE_RUNTIME:
+                backoff = WATCH_INITIAL_BACKOFF
+            # Without the watch the lists go stale silently, so it is restarted
+            print(f"Watch exited with {process.returncode}, restarting it in {backoff:.0f}s")
+            stopped.wait(backoff)
+            backoff = min(backoff * 2, WATCH_MAX_BACKOFF)
+
+    def unwatch(self):
+        if self.watch_stopped is not None:
+            self.watch_stopped.set()
+            self.watch_stopped = None
+        with self.watch_lock:
+            process, self.watch_process = self.watch_process, None
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+class DaemonChannel:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.process = None
+
+
+class McstDaemonBackend(McstBackend):
+    def __init__(self):
+        super().__init__()
+        self.channel = DaemonChannel()
+        # Probes wait for network timeouts, on their own connection they do not hold up the other calls
+        self.network_channel = DaemonChannel()
+
+    def connect(self, channel: DaemonChannel):
+        command = os.path.expanduser(self.command_template)
+        channel.process = subprocess.Popen([command, "connect"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def disconnect(self):
+        for channel in (self.channel, self.network_channel):
+            with channel.lock:
+                if channel.process is not None:
+                    channel.process.stdin.close()
+                    channel.process.wait()
+                    channel.process = None
+
+    def call(self, op: str, channel: DaemonChannel = None, **args):
+        channel = channel or self.channel
+        request = {"op": op, "args": args}
+        with channel.lock:
+            response = None
+            for attempt in range(2):
+                if channel.process is None or channel.process.poll() is not None:
+                    self.connect(channel)
+                try:
+                    self.write_frame(channel, request)
+                    response = self.read_frame(channel)
+                except BrokenPipeError:
+                    response = None
+                if response is not None:
+                    break
+                channel.process = None
+        if response is None:
+            raise ConnectionError("mcst daemon is not reachable")
+        if response["ok"] is False:
+            raise REMOTE_ERRORS.get(response["error"], RuntimeError)(response["message"])
+        return response.get("result")
+
+    # noinspection PyMethodMayBeStatic
+    def write_frame(self, channel: DaemonChannel, message: dict):
+        payload = json.dumps(message).encode("utf-8")
+        channel.process.stdin.write(FRAME_HEADER.pack(len(payload)) + payload)
+        channel.process.stdin.flush()
+
+    # noinspection PyMethodMayBeStatic
+    def read_frame(self, channel: DaemonChannel) -> Optional[dict]:
+        header = channel.process.stdout.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return None
+        (size,) = FRAME_HEADER.unpack(header)
+        payload = channel.process.stdout.read(size)
+        if len(payload) < size:
+            return None
+        return json.loads(payload.decode("utf-8"))
+
+    def list(self) -> List[str]:
+        return self.call("list")
+
+    def list_page(self, offset: int, limit: int, match: str = "") -> dict:
+        return self.call("list-page", offset=offset, limit=limit, match=match)
+
+    def create(self, name: str):
+        self.call("create", name=name)
+
+    def settings_dump(self, name: str) -> str:
+        return self.call("settings-show", name=name)
+
+    def settings_replace(self, name: str, new_content: str):
+        self.call("settings-replace", name=name, content=new_content)
+
+    def settings_get(self, name: str, keys: List[str]) -> Dict[str, str]:
+        return self.call("settings-get", name=name, keys=keys)
+
+    def settings_patch(self, names: List[str], changes: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+        return self.call("settings-patch", names=names, changes=changes)
+
+    def load_info(self, name: str) -> McServerDirectoryInfo:
+        return McServerDirectoryInfo.from_dict(self.call("info", name=name))
+
+    def clone(self, name: str, template: Optional[str]):
+        self.call("clone", name=name, template=template)
+
+    def list_versions(self) -> List[str]:
+        return self.call("list-versions")
+
+    def health(self) -> Dict[str, dict]:
+        return self.call("health", self.network_channel)
+
 
 class McstBackendTest(McstBackendInterface):
     def __init__(self):
@@ -83,6 +291,10 @@ class McstBackendTest(McstBackendInterface):
     def list(self) -> List[str]:
         return self.directories
 
+    def list_page(self, offset: int, limit: int, match: str = "") -> dict:
+        names = [name for name in self.directories if match.casefold() in name.casefold()]
+        return {"names": names[offset:offset + limit], "offset": offset, "total": len(names)}
+
     def create(self, name: str):
         os.system("bc -v")
         self.directories.append(name)
@@ -96,6 +308,13 @@ class McstBackendTest(McstBackendInterface):
         print("New content will be:")
         print(new_content)
 
+    def settings_get(self, name: str, keys: List[str]) -> Dict[str, str]:
+        return {key: f"{key} of {name}" for key in keys}
+
+    def settings_patch(self, names: List[str], changes: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+        print(f"Patching settings of {', '.join(names)}: {changes}")
+        return {name: list(changes) for name in names}
+
     def load_info(self, name: str) -> McServerDirectoryInfo:
         print(f"Retrieving infos for {name}")
         info = McServerDirectoryInfo()
@@ -112,3 +331,12 @@ class McstBackendTest(McstBackendInterface):
 
     def list_versions(self) -> List[str]:
         return ["1.12.1", "1.12.3", "1.14.1", "1.16.1"]
+
+    def health(self) -> Dict[str, dict]:
+        states = ["up", "down", "sleeping", "starting", "timeout"]
+        health = {}
+        for index, name in enumerate(self.directories):
+            health[name] = {"state": states[index % len(states)], "port": 25565 + index, "running": index % 2 == 0}
+            if health[name]["state"] == "up":
+                health[name].update(latency_ms=1.5, online=index, max=20, version="1.16.1", motd=name)
+        return health
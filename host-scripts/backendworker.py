@@ -0,0 +1,96 @@
+import queue
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+POLL_INTERVAL_MS = 50
+
+
+class BackendWorker:
+    def __init__(self, widget, on_busy_changed: Callable[[bool], None], max_workers: int = 4):
+        self.widget = widget
+        self.on_busy_changed = on_busy_changed
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backend")
+        self.results = queue.Queue()
+        self.posted = queue.Queue()
+        self.generations = {}
+        self.futures = {}
+        self.pending = 0
+        self.widget.after(POLL_INTERVAL_MS, self.poll)
+
+    def submit(self, key: Optional[str], function: Callable, *args,
+               on_done: Callable = None, on_error: Callable = None, quiet: bool = False):
+        generation = self.cancel(key)
+        future = self.executor.submit(function, *args)
+        if key is not None:
+            self.futures[key] = future
+        # Background refreshes do not show as busy
+        if not quiet:
+            self.set_pending(self.pending + 1)
+        # Runs on the worker thread, so only hand the result over, Tk is touched in poll
+        future.add_done_callback(lambda f: self.results.put((key, generation, f, on_done, on_error, quiet)))
+
+    def post(self, function: Callable, *args):
+        # For other threads, runs the function on the Tk thread with the next poll
+        self.posted.put((function, args))
+
+    def cancel(self, key: Optional[str]) -> int:
+        if key is None:
+            return 0
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        future = self.futures.pop(key, None)
+        if future is not None:
+            future.cancel()
+        return generation
+
+    def poll(self):
+        try:
+            self.deliver_results()
+            while True:
+                try:
+                    function, args = self.posted.get_nowait()
+                except queue.Empty:
+                    break
+                self.run_callback(function, *args)
+        finally:
+            # A failing callback must not end the delivery of everything after it
+            self.widget.after(POLL_INTERVAL_MS, self.poll)
+
+    def deliver_results(self):
+        while True:
+            try:
+                key, generation, future, on_done, on_error, quiet = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if not quiet:
+                self.set_pending(self.pending - 1)
+            if self.futures.get(key) is future:
+                del self.futures[key]
+            if future.cancelled() or (key is not None and self.generations.get(key) != generation):
+                continue
+            error = future.exception()
+            if error is None:
+                if on_done is not None:
+                    self.run_callback(on_done, future.result())
+            elif on_error is not None:
+                self.run_callback(on_error, error)
+            else:
+                traceback.print_exception(type(error), error, error.__traceback__)
+
+    # noinspection PyMethodMayBeStatic
+    def run_callback(self, function: Callable, *args):
+        try:
+            function(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def set_pending(self, pending: int):
+        was_busy = self.pending > 0
+        self.pending = pending
+        if was_busy != (pending > 0):
+            self.on_busy_changed(pending > 0)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+import argparse
+import json
+import math
+import os
+import pathlib
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Callable, Dict, List, Optional
+
+from backendinterface import McstBackend, McstBackendInterface, McstBackendTest
+
+
+SCRIPTS_DIR = pathlib.Path(__file__).resolve().parent.parent / "scripts"
+VERSION = "1.16.1"
+PORT = "25565"
+IDLE_TIMEOUT = 30.0
+
+FAKE_JAVA = """#!{python}
+import os, pathlib, sys, time
+with open({counter!r}, "ab") as counter:
+    counter.write(b"x")
+if sys.argv[1:] == ["-version"]:
+    print('openjdk version "17.0.2" 2022-01-18\\nOpenJDK Runtime Environment (build 17.0.2+8-86)', file=sys.stderr)
+    sys.exit(0)
+eula = pathlib.Path("eula.txt")
+if not eula.exists():
+    eula.write_text("eula=false\\n")
+    pathlib.Path("server.properties").write_text("#Minecraft server properties\\nserver-port=25565\\nmotd=A Minecraft Server\\n")
+    sys.exit(0)
+os.makedirs("logs", exist_ok=True)
+with open("logs/latest.log", "w") as log:
+    log.write(time.strftime("[%H:%M:%S]") + ' [Server thread/INFO]: Done (0.001s)! For help, type "help"\\n')
+for arg in sys.argv:
+    if arg.startswith("-XX:ArchiveClassesAtExit="):
+        pathlib.Path(arg.split("=", 1)[1]).write_bytes(b"jsa")
+"""
+
+WRAPPER = """#!/bin/sh
+printf x >> {counter}
+# mcst.log goes to the working directory, the tree keeps it out of the caller's
+cd {root} || exit 1
+MCST_SERVERS_DIR={servers} MCST_JARS_DIR={jars} MCST_JAVA={java} exec {python} {mcst} "$@"
+"""
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class BenchmarkTree:
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+        self.servers_dir = root / "servers"
+        self.jars_dir = root / "jars"
+        self.java = root / "bin" / "java"
+        self.wrapper = root / "bin" / "mcst.sh"
+        self.mcst_counter = root / "mcst-processes"
+        self.java_counter = root / "java-processes"
+
+    def create(self):
+        self.servers_dir.mkdir(parents=True)
+        self.jars_dir.mkdir()
+        self.java.parent.mkdir()
+        for jarname in ("server.jar", f"minecraft_server.{VERSION}.jar"):
+            with zipfile.ZipFile(self.jars_dir / jarname, "w") as jar:
+                jar.writestr("version.json", json.dumps({"id": VERSION, "name": VERSION}))
+        self.java.write_text(FAKE_JAVA.format(python=sys.executable, counter=f"{self.java_counter}"))
+        self.wrapper.write_text(WRAPPER.format(counter=self.mcst_counter, root=self.root,
+                                               servers=self.servers_dir, jars=self.jars_dir, java=self.java, python=sys.executable,
+                                               mcst=SCRIPTS_DIR / "mcst.py"))
+        for script in (self.java, self.wrapper):
+            script.chmod(0o755)
+        for counter in (self.mcst_counter, self.java_counter):
+            counter.touch()
+
+    def processes(self) -> Dict[str, int]:
+        return {"mcst": self.mcst_counter.stat().st_size, "java": self.java_counter.stat().st_size}
+
+    def wait_idle(self, name: str):
+        # A detached start returns before the server exits, the next start of it has to wait for that
+        console = self.servers_dir / ".mcst" / "consoles" / f"{name}.sock"
+        deadline = time.monotonic() + IDLE_TIMEOUT
+        while console.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+class Benchmark:
+    def __init__(self, backend: McstBackendInterface, tree: Optional[BenchmarkTree], iterations: int):
+        self.backend = backend
+        self.tree = tree
+        self.iterations = iterations
+        self.name = None
+        self.settings = None
+
+    def setup(self):
+        if self.tree is None:
+            self.name = self.backend.list()[0]
+        else:
+            self.name = "bench"
+            self.backend.create(self.name)
+        self.settings = self.backend.settings_dump(self.name)
+
+    def operations(self) -> List[tuple]:
+        return [
+            ("list", lambda index: self.backend.list()),
+            ("list_page", lambda index: self.backend.list_page(0, 100)),
+            ("list_versions", lambda index: self.backend.list_versions()),
+            ("load_info", lambda index: self.backend.load_info(self.name)),
+            ("settings_dump", lambda index: self.backend.settings_dump(self.name)),
+            ("settings_replace", lambda index: self.backend.settings_replace(self.name, self.settings)),
+            ("settings_get", lambda index: self.backend.settings_get(self.name, ["motd", "server-port"])),
+            ("settings_patch", lambda index: self.backend.settings_patch([self.name], {"motd": f"Benchmark {index}"})),
+            ("create", lambda index: self.backend.create(f"bench-create-{index}")),
+            ("clone", lambda index: self.backend.clone(f"bench-clone-{index}", self.name)),
+            ("start", lambda index: self.backend.start(self.name, PORT, VERSION)),
+        ]
+
+    def processes(self) -> Dict[str, int]:
+        return self.tree.processes() if self.tree is not None else {"mcst": 0, "java": 0}
+
+    def measure(self, operation: str, function: Callable[[int], object]) -> dict:
+        timings = []
+        before = self.processes()
+        for index in range(self.iterations):
+            started = time.perf_counter()
+            function(index)
+            timings.append(time.perf_counter() - started)
+            if operation == "start" and self.tree is not None:
+                self.tree.wait_idle(self.name)
+        after = self.processes()
+        return {
+            "iterations": self.iterations,
+            "p50_ms": percentile(timings, 0.50) * 1000,
+            "p95_ms": percentile(timings, 0.95) * 1000,
+            "p99_ms": percentile(timings, 0.99) * 1000,
+            "mean_ms": sum(timings) / len(timings) * 1000,
+            "max_ms": max(timings) * 1000,
+            "mcst_processes_per_call": (after["mcst"] - before["mcst"]) / self.iterations,
+            "java_processes_per_call": (after["java"] - before["java"]) / self.iterations,
+        }
+
+    def run(self, selected: List[str]) -> Dict[str, dict]:
+        self.setup()
+        results = {}
+        for operation, function in self.operations():
+            if selected and operation not in selected:
+                continue
+            results[operation] = self.measure(operation, function)
+        return results
+
+
+def print_results(results: Dict[str, Dict[str, dict]], baseline: Optional[dict]):
+    print(f"{'backend':<10} {'operation':<17} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+          f" {'mcst/call':>9} {'java/call':>9} {'p50 vs base':>11}")
+    for backend, operations in results.items():
+        for operation, result in operations.items():
+            line = (f"{backend:<10} {operation:<17} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+                    f" {result['p99_ms']:>9.2f} {result['mcst_processes_per_call']:>9.1f}"
+                    f" {result['java_processes_per_call']:>9.1f}")
+            base = (baseline or {}).get("results", {}).get(backend, {}).get(operation)
+            if base is not None and base["p50_ms"] > 0:
+                line += f" {result['p50_ms'] / base['p50_ms']:>10.2f}x"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the latency of the backend operations")
+    parser.add_argument("--backend", type=str, action="append", choices=["cli", "test"], default=[],
+                        help="Backend to measure, can be repeated; all of them by default")
+    parser.add_argument("--operation", type=str, action="append", default=[],
+                        help="Operation to measure, can be repeated; all of them by default")
+    parser.add_argument("--iterations", type=int, default=20, help="Calls per operation")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, help="Compare with the results in this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary servers and jars tree")
+    args = parser.parse_args()
+
+    # McstBackendTest runs interactive tools, they must not wait for a terminal
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+
+    root = pathlib.Path(tempfile.mkdtemp(prefix="mcst-benchmark-"))
+    results = {}
+    try:
+        for backend_name in args.backend or ["cli", "test"]:
+            if backend_name == "cli":
+                tree = BenchmarkTree(root / backend_name)
+                tree.create()
+                backend = McstBackend()
+                backend.command_template = f"{tree.wrapper}"
+            else:
+                tree = None
+                backend = McstBackendTest()
+            results[backend_name] = Benchmark(backend, tree, args.iterations).run(args.operation)
+    finally:
+        if args.keep:
+            print(f"Kept {root}", file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,10 @@ class McServerDirectoryInfo:
 
     @staticmethod
     def load(output: str) -> "McServerDirectoryInfo":
+        return McServerDirectoryInfo.from_dict(json.loads(output))
+
+    @staticmethod
+    def from_dict(data: dict) -> "McServerDirectoryInfo":
         info = McServerDirectoryInfo()
-        data = json.loads(output)
         info.last_server_version = data.get(PROP_LAST_SERVER_VERSION, "")
         return info
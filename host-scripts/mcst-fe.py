@@ -2,9 +2,17 @@
 import sys
 import tkinter as tk
 
-from backendinterface import McstBackendInterface, McstBackend, McstBackendTest
+from backendcache import McstBackendCache
+from backendworker import BackendWorker
+from backendinterface import McstBackendInterface, McstBackend, McstBackendTest, McstDaemonBackend
+from nameindex import NameIndex
+from propertiesdiff import diff_properties
 
 BUTTON_WIDTH = 16
+LIST_PAGE_SIZE = 500
+VISIBLE_CHUNK = 100
+HEALTH_INTERVAL_MS = 15000
+STATE_COLORS = {"up": "dark green", "sleeping": "blue", "starting": "dark orange", "timeout": "red", "error": "red"}
 
 
 class McstFrontend(tk.Frame):
@@ -16,21 +24,29 @@ class McstFrontend(tk.Frame):
 
         self.directories_prop = tk.StringVar(master=master, value=())
         self.directories = []
+        self.directory_index = NameIndex()
+        self.health = {}
+        self.matches = []
+        self.filter_text = ""
         self.config_loaded = False
+        self.loaded_config = None
         self.selected_dir = None
         self.new_name = None
         self.default_version = "1.16.1"
-        self.versions = self.backend.list_versions()
-        assert self.default_version in self.versions
+        self.versions = [self.default_version]
         self.selected_version = tk.StringVar(master=master)
         self.port = "25565"
 
         self.directory_selection_frame = None
         self.refresh_directories_button = None
+        self.filter_textbox = None
+        self.directories_frame = None
         self.directories_list = None
+        self.directories_scrollbar = None
         self.new_name_textbox = None
         self.new_name_button = None
         self.quit_button = None
+        self.busy_label = None
 
         self.directory_operations_frame = None
         self.config_frame = None
@@ -43,10 +59,21 @@ class McstFrontend(tk.Frame):
         self.versions_list = None
         self.directory_start_button = None
 
+        self.worker = BackendWorker(self, self.busy_changed)
+        self.bind("<Destroy>", lambda event: self.shutdown())
+
         self.create_widgets()
         self.arrange_widgets()
+        self.worker.submit("versions", self.backend.list_versions, on_done=self.versions_loaded)
         self.refresh_directories()
+        self.refresh_health()
         self.new_name_modified(None)
+        # Changes made by anyone show up without refreshing, the backend pushes them
+        self.backend.watch(lambda event: self.worker.post(self.server_changed, event))
+
+    def shutdown(self):
+        self.backend.unwatch()
+        self.worker.shutdown()
 
     def create_widgets(self):
         self.directory_selection_frame = tk.Frame(self)
@@ -55,8 +82,15 @@ class McstFrontend(tk.Frame):
             master=self.directory_selection_frame,
             text="Refresh",
             width=BUTTON_WIDTH,
-            command=self.refresh_directories
+            command=self.reload_directories
+        )
+
+        self.filter_textbox = tk.Text(
+            master=self.directory_selection_frame,
+            height=1,
+            width=22
         )
+        self.filter_textbox.bind("<<Modified>>", self.filter_modified)
 
         self.new_name_textbox = tk.Text(
             master=self.directory_selection_frame,
@@ -79,13 +113,27 @@ class McstFrontend(tk.Frame):
             command=self.master.destroy
         )
 
-        self.directories_list = tk.Listbox(
+        self.busy_label = tk.Label(
             master=self.directory_selection_frame,
+            text="",
+            width=BUTTON_WIDTH
+        )
+
+        self.directories_frame = tk.Frame(self.directory_selection_frame)
+
+        self.directories_list = tk.Listbox(
+            master=self.directories_frame,
             selectmode=tk.SINGLE,
             listvariable=self.directories_prop,
+            yscrollcommand=self.directories_scrolled
         )
         self.directories_list.bind('<<ListboxSelect>>', self.dir_selected)
 
+        self.directories_scrollbar = tk.Scrollbar(
+            master=self.directories_frame,
+            command=self.directories_list.yview
+        )
+
         self.directory_operations_frame = tk.Frame(self)
         self.config_frame = tk.Frame(self.directory_operations_frame)
         self.config_operations_frame = tk.Frame(self.config_frame)
@@ -148,10 +196,14 @@ class McstFrontend(tk.Frame):
     def arrange_widgets(self):
         self.directory_selection_frame.pack(side=tk.LEFT, fill=tk.Y, expand=True)
         self.refresh_directories_button.pack()
-        self.directories_list.pack(fill=tk.Y, expand=True)
+        self.filter_textbox.pack()
+        self.directories_frame.pack(fill=tk.Y, expand=True)
+        self.directories_list.pack(side=tk.LEFT, fill=tk.Y, expand=True)
+        self.directories_scrollbar.pack(side=tk.LEFT, fill=tk.Y)
         self.new_name_textbox.pack()
         self.new_name_button.pack()
         self.quit_button.pack()
+        self.busy_label.pack()
         self.directory_operations_frame.pack()
         self.config_frame.pack()
         self.config_operations_frame.pack()
@@ -163,12 +215,125 @@ class McstFrontend(tk.Frame):
         self.versions_list.pack()
         self.directory_start_button.pack()
 
+    def busy_changed(self, busy: bool):
+        self.busy_label.config(text="Working..." if busy else "")
+        self.winfo_toplevel().config(cursor="watch" if busy else "")
+
+    def versions_loaded(self, versions):
+        self.versions = versions or [self.default_version]
+        # The jar store may not have the built-in default, its first version stands in then
+        if self.default_version not in self.versions:
+            self.default_version = self.versions[0]
+        if self.selected_version.get() not in self.versions:
+            self.choose_version(self.default_version)
+        menu = self.versions_list["menu"]
+        menu.delete(0, tk.END)
+        for version in self.versions:
+            menu.add_command(label=version, command=tk._setit(self.selected_version, version))
+
+    def reload_directories(self):
+        self.backend.invalidate()
+        self.refresh_directories()
+
     def refresh_directories(self):
-        self.directories = self.backend.list()
-        self.directories_prop.set(self.directories)
+        self.worker.submit("list", self.backend.list_page, 0, LIST_PAGE_SIZE, on_done=self.directories_loaded)
+
+    def directories_loaded(self, page):
+        if page["offset"] == 0:
+            self.directory_index.clear()
+            self.directories_list.selection_clear(0, tk.END)
+            self.set_directory_operations_state(tk.DISABLED)
+            self.dir_selected(None)
+        self.directory_index.add(page["names"])
+        # The first page is shown right away, the rest is fetched in the background
+        loaded = page["offset"] + len(page["names"])
+        if page["names"] and loaded < page["total"]:
+            self.worker.submit("list", self.backend.list_page, loaded, LIST_PAGE_SIZE, on_done=self.directories_loaded)
+        self.apply_filter(len(self.directories))
+        self.update_new_name_button()
+
+    def refresh_health(self):
+        self.worker.submit("health", self.backend.health, on_done=self.health_loaded, on_error=self.health_failed,
+                           quiet=True)
+
+    def health_loaded(self, health: dict):
+        self.health = health
+        self.show_directories()
+        self.after(HEALTH_INTERVAL_MS, self.refresh_health)
+
+    def health_failed(self, error: Exception):
+        print(f"Health check failed: {error!r}")
+        self.after(HEALTH_INTERVAL_MS, self.refresh_health)
+
+    def directory_label(self, name: str) -> str:
+        health = self.health.get(name)
+        if health is None or health["state"] == "down":
+            return name
+        if health["state"] == "up":
+            return f"{name}  [up {health['online']}/{health['max']}, {health['latency_ms']:.0f} ms]"
+        return f"{name}  [{health['state']}]"
+
+    def color_directories(self, first: int):
+        for index in range(first, len(self.directories)):
+            state = self.health.get(self.directories[index], {}).get("state")
+            self.directories_list.itemconfig(index, foreground=STATE_COLORS.get(state, "black"))
+
+    def server_changed(self, event: dict):
+        name = event["name"]
+        if event["event"] == "settings":
+            if name == self.selected_dir and self.config_loaded:
+                self.settings_changed(name)
+            return
+        if event["event"] == "added":
+            self.directory_index.add([name])
+        else:
+            self.directory_index.remove([name])
+        self.apply_filter(len(self.directories))
+        self.update_new_name_button()
+
+    def settings_changed(self, name: str):
+        editor_text = self.config_editor_textbox.get("1.0", tk.END)
+        if editor_text.strip() == self.loaded_config.strip():
+            self.load_config()
+        else:
+            print(f"Settings of {name} were changed meanwhile, Load shows them but discards your edits")
+
+    def filter_modified(self, event):
+        self.filter_textbox.edit_modified(False)
+        filter_text = self.filter_textbox.get("1.0", tk.END).strip()
+        if filter_text == self.filter_text:
+            return
+        self.filter_text = filter_text
+        self.apply_filter(VISIBLE_CHUNK)
+
+    def apply_filter(self, shown: int):
+        self.matches = self.directory_index.search(self.filter_text)
+        if self.selected_dir in self.directory_index:
+            try:
+                shown = max(shown, self.matches.index(self.selected_dir) + 1)
+            except ValueError:
+                pass
+        # Only a chunk goes into the listbox, more is added when scrolling gets near its end
+        self.directories = self.matches[:max(shown, VISIBLE_CHUNK)]
+        self.show_directories()
+
+    def show_directories(self):
+        # The listbox shows labels with the health of the server, self.directories keeps the names
+        self.directories_prop.set([self.directory_label(name) for name in self.directories])
+        self.color_directories(0)
         self.directories_list.selection_clear(0, tk.END)
-        self.set_directory_operations_state(tk.DISABLED)
-        self.dir_selected(None)
+        if self.selected_dir in self.directories:
+            self.directories_list.selection_set(self.directories.index(self.selected_dir))
+        elif self.selected_dir is not None:
+            self.dir_selected(None)
+
+    def directories_scrolled(self, first: str, last: str):
+        self.directories_scrollbar.set(first, last)
+        if float(last) > 0.9 and len(self.directories) < len(self.matches):
+            chunk = self.matches[len(self.directories):len(self.directories) + VISIBLE_CHUNK]
+            self.directories.extend(chunk)
+            self.directories_list.insert(tk.END, *(self.directory_label(name) for name in chunk))
+            self.color_directories(len(self.directories) - len(chunk))
 
     def set_directory_operations_state(self, state):
         for button in (
@@ -182,6 +347,9 @@ class McstFrontend(tk.Frame):
     # noinspection PyUnusedLocal
     def dir_selected(self, event):
         selection = self.directories_list.curselection()
+        # Whatever is still on its way belongs to the previous selection
+        self.worker.cancel("info")
+        self.worker.cancel("config")
         if len(selection) == 0:
             self.selected_dir = None
             self.set_directory_operations_state(tk.DISABLED)
@@ -195,7 +363,9 @@ class McstFrontend(tk.Frame):
         self.set_directory_operations_state(tk.NORMAL)
         self.new_name_button.config(text="Clone")
         self.clear_config()
-        self.update_dirversion(self.backend.load_info(self.selected_dir).last_server_version)
+        self.update_dirversion("")
+        self.worker.submit("info", self.backend.load_info, self.selected_dir,
+                           on_done=lambda info: self.update_dirversion(info.last_server_version))
 
     def port_modified(self, event):
         new_port = self.port_textbox.get("1.0", tk.END).strip()
@@ -207,29 +377,32 @@ class McstFrontend(tk.Frame):
         if new_name == self.new_name:
             return
         self.new_name = new_name
+        self.update_new_name_button()
+        self.new_name_textbox.edit_modified(False)
+
+    def update_new_name_button(self):
         button_state = tk.NORMAL if self.is_new_name_valid() else tk.DISABLED
         self.new_name_button.config(state=button_state)
-        self.new_name_textbox.edit_modified(False)
 
     def is_new_name_valid(self):
-        return self.new_name and self.new_name not in self.directories
+        return self.new_name and self.new_name not in self.directory_index
 
     def create_server_directory(self):
         if self.is_new_name_valid() is False:
             print("Invalid name specified!")
             return
-        self.winfo_toplevel().iconify()
         if self.selected_dir is None:
-            self.backend.create(self.new_name)
+            self.worker.submit(None, self.backend.create, self.new_name,
+                               on_done=lambda result: self.refresh_directories())
         else:
-            self.backend.clone(self.new_name, self.selected_dir)
-        self.winfo_toplevel().deiconify()
-        self.refresh_directories()
+            self.worker.submit(None, self.backend.clone, self.new_name, self.selected_dir,
+                               on_done=lambda result: self.refresh_directories())
         self.new_name_textbox.delete("1.0", tk.END)
 
     def clear_config(self):
         self.config_editor_textbox.delete("1.0", tk.END)
         self.config_loaded = False
+        self.loaded_config = None
 
     def update_dirversion(self, version_text: str):
         self.config_editor_version.config(state=tk.NORMAL)
@@ -246,11 +419,18 @@ class McstFrontend(tk.Frame):
             print("No server directory selected")
             return
 
-        editor_text = self.backend.settings_dump(self.selected_dir)
+        self.worker.submit("config", self.fetch_config, self.selected_dir, on_done=self.config_fetched)
+
+    def fetch_config(self, name: str):
+        return self.backend.settings_dump(name), self.backend.load_info(name)
+
+    def config_fetched(self, result):
+        editor_text, info = result
         self.config_editor_textbox.delete("1.0", tk.END)
         self.config_editor_textbox.insert("1.0", editor_text)
-        self.update_dirversion(self.backend.load_info(self.selected_dir).last_server_version)
+        self.update_dirversion(info.last_server_version)
         self.config_loaded = True
+        self.loaded_config = editor_text
 
     def save_config(self):
         if self.selected_dir is None:
@@ -261,7 +441,21 @@ class McstFrontend(tk.Frame):
             return
 
         editor_text = self.config_editor_textbox.get("1.0", tk.END)
-        self.backend.settings_replace(self.selected_dir, editor_text)
+        name = self.selected_dir
+        changes = diff_properties(self.loaded_config, editor_text)
+        if changes:
+            self.worker.submit(None, self.backend.settings_patch, [name], changes,
+                               on_done=lambda result: self.config_saved(name, editor_text))
+        elif editor_text.strip() != self.loaded_config.strip():
+            # Only comments or formatting changed, there is no key to patch
+            self.worker.submit(None, self.backend.settings_replace, name, editor_text,
+                               on_done=lambda result: self.config_saved(name, editor_text))
+        else:
+            print("No changes to save")
+
+    def config_saved(self, name: str, editor_text: str):
+        if name == self.selected_dir and self.config_loaded:
+            self.loaded_config = editor_text
 
     def start(self):
         if self.selected_dir is None:
@@ -272,11 +466,14 @@ class McstFrontend(tk.Frame):
         if self.is_port_valid(port) is False:
             print("Invalid port number")
             return
-        self.winfo_toplevel().iconify()
-        print(f"Starting {self.selected_dir} using v{version} on port {port}, this will be your console:")
-        self.backend.start(self.selected_dir, port, version)
-        print(f"Server stopped, you can continue on the GUI")
-        self.winfo_toplevel().deiconify()
+        print(f"Starting {self.selected_dir} using v{version} on port {port}")
+        name = self.selected_dir
+        self.worker.submit(None, self.backend.start, name, port, version,
+                           on_done=lambda result: self.server_started(name))
+
+    # noinspection PyMethodMayBeStatic
+    def server_started(self, name: str):
+        print(f"{name} is running in the background, its console: mcst.sh attach {name}")
 
     def choose_version(self, version):
         self.selected_version.set(version)
@@ -293,9 +490,18 @@ def main():
     root = tk.Tk()
     root.title("MC Server Tool Frontend")
     root.eval(f'tk::PlaceWindow . center')
-    backend = McstBackendTest() if "--devmode" in sys.argv else McstBackend()
+    if "--devmode" in sys.argv:
+        backend = McstBackendTest()
+    elif "--daemon" in sys.argv:
+        backend = McstDaemonBackend()
+    else:
+        backend = McstBackend()
+    if "--nocache" not in sys.argv:
+        backend = McstBackendCache(backend)
     app = McstFrontend(master=root, backend=backend)
     app.mainloop()
+    if isinstance(backend, McstBackendCache):
+        print(f"Backend cache: {backend.stats()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import bisect
+from typing import Iterable, List, Set
+
+
+GRAM_SIZE = 3
+
+
+def grams(text: str) -> Set[str]:
+    return {text[index:index + GRAM_SIZE] for index in range(len(text) - GRAM_SIZE + 1)}
+
+
+class NameIndex:
+    def __init__(self):
+        self.names = set()
+        self.folded = []
+        self.by_folded = {}
+        self.postings = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def clear(self):
+        self.names.clear()
+        self.folded.clear()
+        self.by_folded.clear()
+        self.postings.clear()
+
+    def add(self, names: Iterable[str]):
+        for name in names:
+            if name in self.names:
+                continue
+            self.names.add(name)
+            folded = name.casefold()
+            if folded not in self.by_folded:
+                bisect.insort(self.folded, folded)
+                self.by_folded[folded] = []
+            self.by_folded[folded].append(name)
+            for gram in grams(folded):
+                self.postings.setdefault(gram, set()).add(folded)
+
+    def remove(self, names: Iterable[str]):
+        for name in names:
+            if name not in self.names:
+                continue
+            self.names.discard(name)
+            folded = name.casefold()
+            self.by_folded[folded].remove(name)
+            if self.by_folded[folded]:
+                continue
+            del self.by_folded[folded]
+            del self.folded[bisect.bisect_left(self.folded, folded)]
+            for gram in grams(folded):
+                self.postings[gram].discard(folded)
+
+    def all(self) -> List[str]:
+        return [name for folded in self.folded for name in self.by_folded[folded]]
+
+    def search(self, text: str) -> List[str]:
+        query = text.casefold()
+        if not query:
+            return self.all()
+        # Names starting with the query come first, in order, found by bisecting the sorted names
+        start = bisect.bisect_left(self.folded, query)
+        end = bisect.bisect_left(self.folded, query + "\U0010ffff", start)
+        prefixed = self.folded[start:end]
+        if len(query) < GRAM_SIZE:
+            candidates = self.folded
+        else:
+            # Every gram of the query must occur in a matching name, the rarest one narrows it down the most
+            query_grams = sorted(grams(query), key=lambda gram: len(self.postings.get(gram, ())))
+            candidates = set(self.postings.get(query_grams[0], ()))
+            for gram in query_grams[1:]:
+                candidates &= self.postings.get(gram, set())
+                if not candidates:
+                    break
+            candidates = sorted(candidates)
+        prefixed_set = set(prefixed)
+        contained = [folded for folded in candidates if query in folded and folded not in prefixed_set]
+        return [name for folded in prefixed + contained for name in self.by_folded[folded]]
@@ -0,0 +1,40 @@
+import re
+from typing import Dict, Optional
+
+
+ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "f": "\f"}
+ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+SEPARATOR = re.compile(r"^((?:\\.|[^=:\s\\])*)\s*[=:]?\s*(.*)$", re.DOTALL)
+
+
+def unescape(text: str) -> str:
+    def replace(match: re.Match) -> str:
+        escaped = match.group(1)
+        if len(escaped) == 5:
+            return chr(int(escaped[1:], 16))
+        return ESCAPES.get(escaped, escaped)
+    return ESCAPE.sub(replace, text)
+
+
+def parse_properties(content: str) -> Dict[str, str]:
+    properties = {}
+    logical = ""
+    for physical in content.splitlines():
+        logical += physical.lstrip()
+        # A line ending in an odd number of backslashes continues on the next one
+        if (len(logical) - len(logical.rstrip("\\"))) % 2 == 1:
+            logical = logical[:-1]
+            continue
+        if logical and logical[0] not in "#!":
+            key, value = SEPARATOR.match(logical).groups()
+            properties[unescape(key)] = unescape(value)
+        logical = ""
+    return properties
+
+
+def diff_properties(old_content: str, new_content: str) -> Dict[str, Optional[str]]:
+    old = parse_properties(old_content)
+    new = parse_properties(new_content)
+    changes = {key: value for key, value in new.items() if old.get(key) != value}
+    changes.update({key: None for key in old if key not in new})
+    return changes
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import pathlib
+import shutil
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from storage import file_lock, read_json, write_json_atomic
+
+
+CHUNK_SIZE = 256 * 1024
+COMPRESSION_LEVEL = 6
+
+
+def chunk_path(store_dir: pathlib.Path, digest: str) -> pathlib.Path:
+    return store_dir / "chunks" / digest[:2] / digest
+
+
+def store_file(store_dir: pathlib.Path, path: pathlib.Path) -> Tuple[List[str], int]:
+    digests = []
+    stored = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest = hashlib.sha256(chunk).hexdigest()
+            digests.append(digest)
+            target = chunk_path(store_dir, digest)
+            if target.exists():
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temporary = target.with_name(f".{digest}.{os.getpid()}.tmp")
+            compressed = zlib.compress(chunk, COMPRESSION_LEVEL)
+            temporary.write_bytes(compressed)
+            os.replace(temporary, target)
+            stored += len(compressed)
+    return digests, stored
+
+
+def restore_file(store_dir: pathlib.Path, path: pathlib.Path, digests: List[str]):
+    with open(path, "wb") as f:
+        for digest in digests:
+            chunk = zlib.decompress(chunk_path(store_dir, digest).read_bytes())
+            if hashlib.sha256(chunk).hexdigest() != digest:
+                raise ValueError(f"Corrupt chunk {digest} in {store_dir}")
+            f.write(chunk)
+
+
+class BackupStore:
+    def __init__(self, store_dir: pathlib.Path, workers: int = None, encoding: str = "utf-8"):
+        self.store_dir = store_dir
+        self.snapshots_dir = store_dir / "snapshots"
+        self.workers = workers
+        self.encoding = encoding
+
+    def locked(self):
+        # Guards the chunks and every manifest at once, there is no single JSON file to hold
+        return file_lock(self.store_dir / "store.lock")
+
+    def snapshots(self, name: str) -> List[str]:
+        directory = self.snapshots_dir / name
+        if directory.exists() is False:
+            return []
+        return sorted(path.stem for path in directory.glob("*.json"))
+
+    def manifest(self, name: str, snapshot: str) -> dict:
+        manifest = read_json(self.snapshots_dir / name / f"{snapshot}.json", None, self.encoding)
+        if manifest is None:
+            raise FileNotFoundError(f"No snapshot {snapshot} of {name}")
+        return manifest
+
+    def backup(self, name: str, source: pathlib.Path) -> dict:
+        with self.locked():
+            previous = self.snapshots(name)
+            previous_files = self.manifest(name, previous[-1])["files"] if previous else {}
+            manifest = {"server": name, "created": time.time(), "chunk_size": CHUNK_SIZE,
+                        "dirs": [], "symlinks": {}, "files": {}, "stored_bytes": 0}
+            changed = []
+            for root, dirs, filenames in os.walk(source):
+                relative_root = pathlib.Path(root).relative_to(source)
+                manifest["dirs"].append(str(relative_root))
+                for filename in filenames:
+                    path = pathlib.Path(root) / filename
+                    relative = str(relative_root / filename)
+                    if path.is_symlink():
+                        manifest["symlinks"][relative] = os.readlink(path)
+                        continue
+                    stat = path.stat()
+                    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "mode": stat.st_mode & 0o7777}
+                    known = previous_files.get(relative)
+                    if known is not None and (known["size"], known["mtime_ns"]) == (entry["size"], entry["mtime_ns"]):
+                        entry["chunks"] = known["chunks"]
+                    else:
+                        changed.append(relative)
+                    manifest["files"][relative] = entry
+            # Hashing and compression are CPU bound, spread them over processes
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(store_file, [self.store_dir] * len(changed),
+                                       [source / relative for relative in changed])
+                for relative, (digests, stored) in zip(changed, results):
+                    manifest["files"][relative]["chunks"] = digests
+                    manifest["stored_bytes"] += stored
+            manifest["id"] = time.strftime("%Y%m%d-%H%M%S", time.localtime(manifest["created"]))
+            while manifest["id"] in previous:
+                manifest["id"] += "a"
+            (self.snapshots_dir / name).mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.snapshots_dir / name / f"{manifest['id']}.json", manifest, self.encoding)
+            return manifest
+
+    def restore(self, name: str, snapshot: Optional[str], target: pathlib.Path) -> dict:
+        # Held so a prune cannot collect chunks this restore still reads
+        with self.locked():
+            if snapshot is None:
+                snapshots = self.snapshots(name)
+                if not snapshots:
+                    raise FileNotFoundError(f"No backups of {name}")
+                snapshot = snapshots[-1]
+            manifest = self.manifest(name, snapshot)
+            if target.exists():
+                raise FileExistsError()
+            try:
+                self.restore_files(manifest, target)
+            except BaseException:
+                # A partial directory would block the next attempt
+                shutil.rmtree(target, ignore_errors=True)
+                raise
+            return manifest
+
+    def restore_files(self, manifest: dict, target: pathlib.Path):
+        for relative in sorted(manifest["dirs"]):
+            (target / relative).mkdir(parents=True, exist_ok=True)
+        files = manifest["files"]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(restore_file, [self.store_dir] * len(files),
+                              [target / relative for relative in files],
+                              [entry["chunks"] for entry in files.values()]))
+        for relative, entry in files.items():
+            os.chmod(target / relative, entry["mode"])
+            os.utime(target / relative, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        for relative, link in manifest["symlinks"].items():
+            os.symlink(link, target / relative)
+
+    def prune(self, name: str, keep: int) -> Tuple[List[str], int]:
+        with self.locked():
+            snapshots = self.snapshots(name)
+            removed = snapshots[:-keep] if keep > 0 else snapshots
+            for snapshot in removed:
+                (self.snapshots_dir / name / f"{snapshot}.json").unlink()
+            return removed, self.collect_garbage()
+
+    def collect_garbage(self) -> int:
+        referenced = set()
+        for manifest_file in self.snapshots_dir.glob("*/*.json"):
+            for entry in read_json(manifest_file, {"files": {}}, self.encoding)["files"].values():
+                referenced.update(entry["chunks"])
+        freed = 0
+        for chunk in (self.store_dir / "chunks").glob("*/*"):
+            if chunk.name not in referenced:
+                freed += chunk.stat().st_size
+                chunk.unlink()
+        return freed
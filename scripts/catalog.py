@@ -0,0 +1,92 @@
+import os
+import pathlib
+import time
+
+from storage import locked_json, read_json
+
+
+STATE_DIRNAME = ".mcst"
+CATALOG_FILENAME = "catalog.json"
+INFO_FILENAME = "mcst-info.json"
+
+
+def directory_size(path: pathlib.Path) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            try:
+                # Allocated blocks like the usage tracker counts, so quotas, usage and info agree on the size
+                total += os.lstat(os.path.join(root, filename)).st_blocks * 512
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def read_server_port(directory: pathlib.Path, encoding: str = "utf-8"):
+    try:
+        with open(directory / "server.properties", encoding=encoding) as f:
+            for line in f:
+                if line.startswith("server-port="):
+                    return int(line.split("=", 1)[1])
+    except (FileNotFoundError, ValueError):
+        pass
+    return None
+
+
+class ServerCatalog:
+    def __init__(self, servers_dir: pathlib.Path, encoding: str = "utf-8"):
+        self.servers_dir = servers_dir
+        self.encoding = encoding
+        self.state_dir = servers_dir / STATE_DIRNAME
+        self.catalog_file = self.state_dir / CATALOG_FILENAME
+        self.lock_file = self.state_dir / "catalog.lock"
+
+    def read(self) -> dict:
+        return read_json(self.catalog_file, {"servers": {}, "servers_mtime_ns": None}, self.encoding)
+
+    def transaction(self):
+        return locked_json(self.catalog_file, self.lock_file, {"servers": {}, "servers_mtime_ns": None}, self.encoding)
+
+    def servers(self) -> dict:
+        data = self.read()
+        # Adding or removing a server directory changes the mtime of /servers, anything else needs no walk
+        if data["servers_mtime_ns"] != self.servers_dir.stat().st_mtime_ns:
+            data = self.reconcile()
+        return data["servers"]
+
+    def update(self, name: str, **values):
+        with self.transaction() as data:
+            data["servers"].setdefault(name, {}).update(values)
+
+    def remove(self, name: str):
+        with self.transaction() as data:
+            data["servers"].pop(name, None)
+
+    def reconcile(self, full: bool = False) -> dict:
+        with self.transaction() as data:
+            servers = data["servers"]
+            present = set()
+            with os.scandir(self.servers_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_dir():
+                        continue
+                    present.add(entry.name)
+                    if full or entry.name not in servers:
+                        servers[entry.name] = self.scan_server(entry.name, servers.get(entry.name, {}))
+            for name in set(servers) - present:
+                del servers[name]
+            data["servers_mtime_ns"] = self.servers_dir.stat().st_mtime_ns
+        return data
+
+    def scan_server(self, name: str, known: dict) -> dict:
+        directory = self.servers_dir / name
+        info = read_json(directory / INFO_FILENAME, {}, self.encoding)
+        entry = {
+            "last_server_version": info.get("last_server_version", known.get("last_server_version", "")),
+            "created": known.get("created", directory.stat().st_mtime),
+            "last_start": known.get("last_start"),
+            "port": read_server_port(directory, self.encoding) or known.get("port"),
+            "size": directory_size(directory),
+            "scanned": time.time(),
+        }
+        return entry
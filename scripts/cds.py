@@ -0,0 +1,153 @@
+import datetime
+import os
+import pathlib
+import re
+import subprocess
+import time
+from typing import List, Optional, Tuple
+
+from storage import read_json, write_json_atomic
+
+
+PENDING_TIMEOUT = 24 * 3600
+MAX_TIMINGS = 50
+SHARING_DESCRIPTIONS = {
+    "used": "with class data sharing",
+    "off": "without class data sharing",
+    "dumping": "while creating the class data archive",
+}
+DONE_LINE = re.compile(r"^\[(\d\d):(\d\d):(\d\d)\].*\]: Done \(")
+JAVA_VERSION = re.compile(r'version "(\d+)(?:\.(\d+))?[^"]*"')
+JAVA_BUILD = re.compile(r"\(build ([^)\s,]+)")
+
+
+def startup_seconds(directory: pathlib.Path, started: float) -> Optional[float]:
+    latest_log = directory / "logs" / "latest.log"
+    try:
+        if latest_log.stat().st_mtime < started:
+            return None
+        with open(latest_log, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = DONE_LINE.match(line)
+                if match is None:
+                    continue
+                start = datetime.datetime.fromtimestamp(started)
+                done = start.replace(hour=int(match.group(1)), minute=int(match.group(2)),
+                                     second=int(match.group(3)), microsecond=0)
+                if done < start - datetime.timedelta(seconds=1):
+                    done += datetime.timedelta(days=1)
+                return max(0.0, (done - start).total_seconds())
+    except OSError:
+        pass
+    return None
+
+
+class ClassDataSharing:
+    def __init__(self, cds_dir: pathlib.Path, java_executable: str, encoding: str = "utf-8"):
+        self.cds_dir = cds_dir
+        self.java_executable = java_executable
+        self.encoding = encoding
+        self.timings_file = cds_dir / "timings.json"
+        self.version = None
+
+    def java_version(self) -> Optional[Tuple[int, str]]:
+        if self.version is None:
+            cache_file = self.cds_dir / "java.json"
+            try:
+                stat = os.stat(os.path.realpath(self.java_executable))
+            except OSError:
+                return None
+            cached = read_json(cache_file, {}, self.encoding)
+            if cached.get("mtime_ns") == stat.st_mtime_ns and cached.get("executable") == self.java_executable:
+                self.version = (cached["feature"], cached["build"])
+            else:
+                self.version = self.query_java_version()
+                if self.version is not None:
+                    self.cds_dir.mkdir(parents=True, exist_ok=True)
+                    write_json_atomic(cache_file, {"executable": self.java_executable, "mtime_ns": stat.st_mtime_ns,
+                                                   "feature": self.version[0], "build": self.version[1]}, self.encoding)
+        return self.version
+
+    def query_java_version(self) -> Optional[Tuple[int, str]]:
+        try:
+            output = subprocess.run([self.java_executable, "-version"], stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, universal_newlines=True, timeout=30).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        version = JAVA_VERSION.search(output)
+        if version is None:
+            return None
+        feature = int(version.group(1))
+        if feature == 1:
+            # Java 8 and older report themselves as 1.x
+            feature = int(version.group(2))
+        build = JAVA_BUILD.search(output)
+        return feature, re.sub(r"[^\w.+-]", "_", build.group(1) if build else version.group(0))
+
+    def archive_key(self, jar_digest: str) -> Optional[str]:
+        version = self.java_version()
+        if version is None or version[0] < 11:
+            return None
+        return f"{jar_digest[:16]}-{version[1]}"
+
+    def jvm_args(self, jar_digest: str) -> Tuple[List[str], str]:
+        key = self.archive_key(jar_digest)
+        if key is None:
+            return [], "off"
+        archive = self.cds_dir / f"{key}.jsa"
+        if archive.exists():
+            return [f"-XX:SharedArchiveFile={archive}", "-Xshare:auto"], "used"
+        if not self.claim(key):
+            return [], "off"
+        if self.java_version()[0] >= 13:
+            return [f"-XX:ArchiveClassesAtExit={archive}"], "dumping"
+        # Java 11 and 12 only know static archives, collect the class list now and dump it after exit
+        return [f"-XX:DumpLoadedClassList={self.cds_dir / key}.classlist"], "dumping"
+
+    def claim(self, key: str) -> bool:
+        self.cds_dir.mkdir(parents=True, exist_ok=True)
+        pending = self.cds_dir / f"{key}.pending"
+        try:
+            if time.time() - pending.stat().st_mtime > PENDING_TIMEOUT:
+                pending.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(pending, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            # Another server on the same jar is creating the archive already
+            return False
+
+    def after_exit(self, jarfile: pathlib.Path, jar_digest: str):
+        key = self.archive_key(jar_digest)
+        if key is None:
+            return
+        classlist = self.cds_dir / f"{key}.classlist"
+        if classlist.exists():
+            subprocess.call([self.java_executable, "-Xshare:dump", f"-XX:SharedClassListFile={classlist}",
+                             f"-XX:SharedArchiveFile={self.cds_dir / key}.jsa", "-cp", f"{jarfile}"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            classlist.unlink()
+        try:
+            (self.cds_dir / f"{key}.pending").unlink()
+        except FileNotFoundError:
+            pass
+
+    def record_startup(self, jar_digest: str, sharing: str, seconds: float) -> str:
+        key = self.archive_key(jar_digest) or jar_digest[:16]
+        self.cds_dir.mkdir(parents=True, exist_ok=True)
+        timings = read_json(self.timings_file, {}, self.encoding)
+        samples = timings.setdefault(key, {"used": [], "off": []})
+        # Writing the archive slows a start down, counted as off it would inflate the saving
+        samples.setdefault(sharing, []).append(seconds)
+        for values in samples.values():
+            del values[:-MAX_TIMINGS]
+        write_json_atomic(self.timings_file, timings, self.encoding)
+        with_sharing = sum(samples["used"]) / len(samples["used"]) if samples["used"] else None
+        without_sharing = sum(samples["off"]) / len(samples["off"]) if samples["off"] else None
+        report = f"Startup took {seconds:.0f}s {SHARING_DESCRIPTIONS[sharing]}"
+        if with_sharing is not None and without_sharing is not None:
+            report += (f", average {with_sharing:.1f}s with it and {without_sharing:.1f}s without it,"
+                       f" saving {without_sharing - with_sharing:.1f}s per start")
+        return report
@@ -0,0 +1,174 @@
+import errno
+import os
+import pathlib
+import selectors
+import socket
+import subprocess
+from typing import Callable, Optional
+
+
+SCROLLBACK_SIZE = 256 * 1024
+MAX_CLIENT_BACKLOG = 1024 * 1024
+READ_SIZE = 65536
+
+
+def is_console_running(socket_path: pathlib.Path) -> bool:
+    if not socket_path.exists():
+        return False
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(f"{socket_path}")
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+class ConsoleClient:
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.pending = bytearray()
+
+
+class ConsoleHost:
+    def __init__(self, socket_path: pathlib.Path, command: list, cwd: pathlib.Path,
+                 on_exit: Optional[Callable[[], None]] = None, scrollback_size: int = SCROLLBACK_SIZE):
+        self.socket_path = socket_path
+        self.command = command
+        self.cwd = cwd
+        self.on_exit = on_exit
+        self.scrollback_size = scrollback_size
+        self.scrollback = bytearray()
+        self.clients = {}
+        self.selector = selectors.DefaultSelector()
+        self.master = None
+        self.running = False
+
+    def spawn_detached(self):
+        if is_console_running(self.socket_path):
+            raise FileExistsError(f"{self.socket_path} is already in use")
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid:
+            os.close(ready_write)
+            ready = os.read(ready_read, 1)
+            os.close(ready_read)
+            os.waitpid(pid, 0)
+            if ready != b"1":
+                raise RuntimeError(f"Console for {self.cwd} did not start")
+            return
+        # Double fork, so the console survives the process (and the docker exec) that started it
+        os.close(ready_read)
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        try:
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            self.serve(ready_write)
+        finally:
+            os._exit(0)
+
+    def serve(self, ready_fd: int = None):
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(f"{self.socket_path}")
+        listener.listen()
+        listener.setblocking(False)
+        master, slave = os.openpty()
+        process = subprocess.Popen(self.command, cwd=self.cwd, stdin=slave, stdout=slave, stderr=slave,
+                                   start_new_session=True)
+        os.close(slave)
+        if ready_fd is not None:
+            os.write(ready_fd, b"1")
+            os.close(ready_fd)
+        self.selector.register(listener, selectors.EVENT_READ, self.accept)
+        self.selector.register(master, selectors.EVENT_READ, self.read_console)
+        self.master = master
+        self.running = True
+        try:
+            while self.running:
+                for key, events in self.selector.select():
+                    key.data(key.fileobj, events)
+        finally:
+            process.wait()
+            for client in list(self.clients.values()):
+                self.drop(client)
+            self.selector.close()
+            listener.close()
+            os.close(master)
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            if self.on_exit is not None:
+                self.on_exit()
+
+    def accept(self, listener: socket.socket, events: int):
+        connection, _ = listener.accept()
+        connection.setblocking(False)
+        client = ConsoleClient(connection)
+        self.clients[connection.fileno()] = client
+        self.selector.register(connection, selectors.EVENT_READ, self.serve_client)
+        # Replay the recent output, so an attaching client sees where the console is at
+        self.send(client, bytes(self.scrollback))
+
+    def read_console(self, master: int, events: int):
+        try:
+            data = os.read(master, READ_SIZE)
+        except OSError as e:
+            if e.errno != errno.EIO:
+                raise
+            # EIO on the master side means the server and everything on its terminal exited
+            data = b""
+        if not data:
+            self.running = False
+            return
+        self.scrollback += data
+        del self.scrollback[:-self.scrollback_size]
+        for client in list(self.clients.values()):
+            self.send(client, data)
+
+    def serve_client(self, connection: socket.socket, events: int):
+        client = self.clients.get(connection.fileno())
+        if client is None:
+            return
+        if events & selectors.EVENT_READ:
+            try:
+                data = connection.recv(READ_SIZE)
+            except OSError:
+                data = b""
+            if not data:
+                self.drop(client)
+                return
+            os.write(self.master, data)
+        if events & selectors.EVENT_WRITE:
+            self.send(client, b"")
+
+    def send(self, client: ConsoleClient, data: bytes):
+        client.pending += data
+        try:
+            while client.pending:
+                sent = client.connection.send(client.pending)
+                del client.pending[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(client)
+            return
+        if len(client.pending) > MAX_CLIENT_BACKLOG:
+            # Too slow to keep up, the console must not stall or buffer without limit for it
+            self.drop(client)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.pending else 0)
+        self.selector.modify(client.connection, events, self.serve_client)
+
+    def drop(self, client: ConsoleClient):
+        self.clients.pop(client.connection.fileno(), None)
+        try:
+            self.selector.unregister(client.connection)
+        except (KeyError, ValueError):
+            pass
+        client.connection.close()
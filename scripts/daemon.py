@@ -0,0 +1,90 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import Optional
+
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+def read_exactly(stream, size: int) -> Optional[bytes]:
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_frame(stream) -> Optional[dict]:
+    header = read_exactly(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame too large: {size}")
+    payload = read_exactly(stream, size)
+    if payload is None:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+
+def write_frame(stream, message: dict):
+    payload = json.dumps(message).encode("utf-8")
+    stream.write(FRAME_HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+class McstRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            request = read_frame(self.rfile)
+            if request is None:
+                return
+            write_frame(self.wfile, self.server.dispatch(request))
+
+
+class McstDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, operations):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, McstRequestHandler)
+        self.operations = operations
+        self.lock = threading.Lock()
+
+    def dispatch(self, request: dict) -> dict:
+        # Read only operations that wait on the network would stall every client behind the lock
+        if isinstance(request, dict) and request.get("op") in self.operations.concurrent:
+            return self.operations.execute(request)
+        # Mcst is not thread safe, connections are served concurrently but operations run one at a time
+        with self.lock:
+            return self.operations.execute(request)
+
+
+def relay(socket_path: str, input_fd: int = 0, output_fd: int = 1):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(socket_path)
+
+    def forward_input():
+        while True:
+            data = os.read(input_fd, 65536)
+            if not data:
+                break
+            connection.sendall(data)
+        connection.shutdown(socket.SHUT_WR)
+
+    threading.Thread(target=forward_input, daemon=True).start()
+    while True:
+        data = connection.recv(65536)
+        if not data:
+            break
+        while data:
+            data = data[os.write(output_fd, data):]
+    connection.close()
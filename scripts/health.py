@@ -0,0 +1,64 @@
+import asyncio
+import struct
+from typing import Dict, List
+
+from slp import description_text, query_status
+
+
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_PORT = 25565
+MAX_CONCURRENT_PROBES = 256
+
+
+class HealthProber:
+    def __init__(self, host: str = "127.0.0.1", timeout: float = DEFAULT_TIMEOUT,
+                 max_concurrent: int = MAX_CONCURRENT_PROBES):
+        self.host = host
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+
+    def probe_all(self, ports: Dict[str, int], running: List[str] = ()) -> Dict[str, dict]:
+        return asyncio.run(self.probe_all_async(ports, running))
+
+    async def probe_all_async(self, ports: Dict[str, int], running: List[str] = ()) -> Dict[str, dict]:
+        # Servers sharing a port get one probe, all probes run at once so the fleet takes about one timeout
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        unique_ports = sorted(set(ports.values()))
+        results = await asyncio.gather(*(self.probe(port, semaphore) for port in unique_ports))
+        by_port = dict(zip(unique_ports, results))
+        health = {}
+        for name, port in ports.items():
+            result = dict(by_port[port], port=port, running=name in running)
+            owner = result.pop("owner", None)
+            sharing = [other for other, other_port in ports.items() if other_port == port]
+            if result["state"] == "sleeping" and owner not in (None, name):
+                result["state"] = "down"
+            elif result["state"] == "up" and not result["running"] and any(other in running for other in sharing):
+                # Another server of the same port answered
+                result["state"] = "down"
+            elif result["state"] == "down" and result["running"]:
+                result["state"] = "starting"
+            health[name] = result
+        return health
+
+    async def probe(self, port: int, semaphore: asyncio.Semaphore) -> dict:
+        async with semaphore:
+            try:
+                status = await query_status(self.host, port, self.timeout)
+            except asyncio.TimeoutError:
+                return {"state": "timeout", "error": f"No answer within {self.timeout:g}s"}
+            except ConnectionRefusedError:
+                return {"state": "down", "error": "Connection refused"}
+            except (OSError, asyncio.IncompleteReadError, ValueError, struct.error) as e:
+                return {"state": "error", "error": f"{e!r}"}
+        players = status.get("players") or {}
+        marker = status.get("mcst") or {}
+        return {
+            "state": "sleeping" if marker.get("state") == "sleeping" else "up",
+            "owner": marker.get("name"),
+            "latency_ms": status["latency_ms"],
+            "online": players.get("online"),
+            "max": players.get("max"),
+            "version": (status.get("version") or {}).get("name"),
+            "motd": description_text(status.get("description")),
+        }
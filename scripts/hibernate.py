@@ -0,0 +1,141 @@
+import asyncio
+import struct
+from typing import Optional
+
+from slp import (LOGIN, PING_PACKET, STATUS, STATUS_REQUEST_PACKET, Handshake, encode_packet, login_disconnect,
+                 query_status, read_packet, status_response)
+from supervisor import INITIAL_BACKOFF, MAX_BACKOFF, PORT_RANGE, ManagedServer, Supervisor
+
+
+IDLE_TIMEOUT = 600.0
+CHECK_INTERVAL = 30.0
+CLIENT_TIMEOUT = 10.0
+STATUS_TIMEOUT = 5.0
+SLEEPING_MOTD = "{motd} - sleeping, join to wake it up"
+WAKING_MESSAGE = "{name} is starting, join again in a minute"
+
+
+class Hibernator(Supervisor):
+    def __init__(self, mcst, idle_timeout: float = IDLE_TIMEOUT, ports: range = PORT_RANGE):
+        super().__init__(mcst, ports)
+        self.idle_timeout = idle_timeout
+
+    async def supervise(self, server: ManagedServer):
+        while not self.stopping.is_set():
+            if not await self.sleep(server):
+                break
+            await self.wake(server)
+
+    async def sleep(self, server: ManagedServer) -> bool:
+        try:
+            motd = self.mcst.load_settings(server.name).get("motd") or "A Minecraft Server"
+        except FileNotFoundError:
+            motd = "A Minecraft Server"
+        woken = asyncio.Event()
+
+        async def answer(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                await asyncio.wait_for(self.answer(server, motd, reader, writer, woken), CLIENT_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError, struct.error):
+                pass
+            finally:
+                writer.close()
+
+        # The listener holds the port only while the server is down, then hands it over
+        listener = await self.listen(server, answer)
+        if listener is None:
+            return False
+        self.mcst.log(f"{server.name} is sleeping, listening on port {server.port}")
+        waits = [asyncio.ensure_future(woken.wait()), asyncio.ensure_future(self.stopping.wait())]
+        try:
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+            listener.close()
+            await listener.wait_closed()
+        return woken.is_set() and not self.stopping.is_set()
+
+    async def listen(self, server: ManagedServer, answer) -> Optional[asyncio.AbstractServer]:
+        # A port still held by something else only keeps this server waiting, not the others
+        while not self.stopping.is_set():
+            try:
+                listener = await asyncio.start_server(answer, port=server.port, reuse_address=True)
+            except OSError as e:
+                self.mcst.log(f"Cannot listen on port {server.port} for {server.name}: {e!r}, "
+                              f"retrying in {server.backoff:.0f}s")
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), server.backoff)
+                except asyncio.TimeoutError:
+                    pass
+                server.backoff = min(server.backoff * 2, MAX_BACKOFF)
+                continue
+            server.backoff = INITIAL_BACKOFF
+            return listener
+        return None
+
+    async def answer(self, server: ManagedServer, motd: str, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter, woken: asyncio.Event):
+        packet_id, payload = await read_packet(reader)
+        handshake = Handshake.decode(payload)
+        if handshake.next_state == STATUS:
+            packet_id, _ = await read_packet(reader)
+            if packet_id != STATUS_REQUEST_PACKET:
+                return
+            # Answering with the protocol of the client lists the sleeping server as compatible,
+            # the mcst field tells health probes that it sleeps
+            marker = {"mcst": {"state": "sleeping", "name": server.name}}
+            writer.write(status_response(SLEEPING_MOTD.format(motd=motd), server.version or "sleeping",
+                                         handshake.protocol, extra=marker))
+            await writer.drain()
+            packet_id, payload = await read_packet(reader)
+            if packet_id == PING_PACKET:
+                writer.write(encode_packet(PING_PACKET, payload))
+                await writer.drain()
+        elif handshake.next_state == LOGIN:
+            writer.write(login_disconnect(WAKING_MESSAGE.format(name=server.name)))
+            await writer.drain()
+            self.mcst.log(f"Login attempt from {writer.get_extra_info('peername')}, waking {server.name}")
+            woken.set()
+
+    async def wake(self, server: ManagedServer):
+        loop = asyncio.get_event_loop()
+        try:
+            launch = self.mcst.prepare_start(server.name, port=server.port, version=server.version,
+                                             planned=list(self.servers))
+        except (OSError, ValueError) as e:
+            self.mcst.log(f"Cannot start {server.name}: {e!r}")
+            return
+        server.process = await asyncio.create_subprocess_exec(
+            *launch.command, cwd=launch.directory,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self.mcst.log(f"Woke {server.name} on port {server.port}, pid {server.process.pid}")
+        # Starting up counts as idle, a server nobody joins after waking it goes back to sleep too
+        idle_since = loop.time()
+        exited = asyncio.ensure_future(server.process.wait())
+        stopping = asyncio.ensure_future(self.stopping.wait())
+        while not exited.done():
+            await asyncio.wait([exited, stopping], timeout=CHECK_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            if exited.done() or stopping.done():
+                break
+            if await self.players_online(server):
+                idle_since = loop.time()
+            elif loop.time() - idle_since > self.idle_timeout:
+                self.mcst.log(f"Nobody played on {server.name} for {self.idle_timeout:.0f}s, putting it to sleep")
+                await self.stop(server)
+        stopping.cancel()
+        returncode = await exited
+        await loop.run_in_executor(None, self.mcst.finish_start, launch)
+        self.mcst.log(f"{server.name} exited with {returncode}")
+
+    # noinspection PyMethodMayBeStatic
+    async def players_online(self, server: ManagedServer) -> int:
+        try:
+            status = await query_status("127.0.0.1", server.port, STATUS_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            # Not listening yet or not answering, which is not a player either
+            return 0
+        return int(status.get("players", {}).get("online", 0))
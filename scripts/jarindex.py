@@ -0,0 +1,148 @@
+import json
+import os
+import pathlib
+import re
+import zipfile
+from typing import List, Optional
+
+from storage import hash_file, read_json, write_json_atomic
+
+
+INDEX_FILENAME = ".mcst-jar-index.json"
+VERSION_IN_FILENAME = re.compile(r"(\d+\.\d+(?:\.\d+)?(?:-(?:pre|rc)\d+)?|\d\dw\d\d[a-z])")
+
+
+def read_jar_metadata(jarfile: pathlib.Path) -> dict:
+    try:
+        with zipfile.ZipFile(jarfile) as archive:
+            with archive.open("version.json") as f:
+                return json.load(f)
+    except (KeyError, ValueError, OSError, zipfile.BadZipFile):
+        # Jars before 1.14 carry no version.json
+        return {}
+
+
+def version_in_filename(filename: str) -> Optional[str]:
+    match = VERSION_IN_FILENAME.search(filename)
+    return match.group(1) if match else None
+
+
+def version_key(version: str):
+    return tuple((0, int(part)) if part.isdigit() else (1, part)
+                 for part in re.split(r"[.\-]", version))
+
+
+class JarIndex:
+    def __init__(self, jars_dir: pathlib.Path, encoding: str = "utf-8", store=None):
+        self.jars_dir = jars_dir
+        self.store = store
+        self.index_file = jars_dir / INDEX_FILENAME
+        self.encoding = encoding
+        self.jars = {}
+        self.versions = {}
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        self.jars = read_json(self.index_file, {}, self.encoding)
+        self.build_versions()
+
+    def save(self):
+        try:
+            write_json_atomic(self.index_file, self.jars, self.encoding)
+        except PermissionError:
+            # A read-only jars mount still works, it is just rescanned more often
+            pass
+
+    def build_versions(self):
+        self.versions = {}
+        for filename in sorted(self.jars):
+            version = self.jars[filename]["version"]
+            if version is not None:
+                self.versions.setdefault(version, filename)
+
+    def refresh(self):
+        if not self.loaded:
+            self.load()
+        changed = False
+        present = set()
+        with os.scandir(self.jars_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".jar") or not entry.is_file():
+                    continue
+                present.add(entry.name)
+                stat = entry.stat()
+                known = self.jars.get(entry.name)
+                if known is not None and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                    continue
+                metadata = self.read_metadata(pathlib.Path(entry.path))
+                self.jars[entry.name] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "version": metadata.get("id") or self.version_from_filename(entry.name),
+                    "metadata": metadata,
+                }
+                changed = True
+        for filename in set(self.jars) - present:
+            del self.jars[filename]
+            changed = True
+        if changed:
+            self.build_versions()
+            self.save()
+
+    # noinspection PyMethodMayBeStatic
+    def read_metadata(self, jarfile: pathlib.Path) -> dict:
+        return read_jar_metadata(jarfile)
+
+    # noinspection PyMethodMayBeStatic
+    def version_from_filename(self, filename: str) -> Optional[str]:
+        return version_in_filename(filename)
+
+    def resolve(self, version: str) -> pathlib.Path:
+        # Imported jars win, their version is known without looking at /jars at all
+        stored = self.store.resolve(version) if self.store is not None else None
+        if stored is not None and stored.exists():
+            return stored
+        if not self.loaded:
+            self.load()
+        filename = self.versions.get(version)
+        if filename is None or not (self.jars_dir / filename).exists():
+            self.refresh()
+            filename = self.versions.get(version)
+        if filename is None:
+            raise FileNotFoundError(f"No jar for version {version}")
+        return self.jars_dir / filename
+
+    def version_of(self, filename: str) -> Optional[str]:
+        if not self.loaded:
+            self.load()
+        if filename not in self.jars:
+            self.refresh()
+        entry = self.jars.get(filename)
+        return entry["version"] if entry else None
+
+    def digest(self, jarfile: pathlib.Path) -> str:
+        stored = self.store.digest_of(jarfile) if self.store is not None else None
+        if stored is not None:
+            return stored
+        if jarfile.parent != self.jars_dir:
+            return hash_file(jarfile)
+        if not self.loaded:
+            self.load()
+        if jarfile.name not in self.jars:
+            self.refresh()
+        entry = self.jars.get(jarfile.name)
+        if entry is None:
+            # Only *.jar files are indexed, any other file in /jars can still be started
+            return hash_file(jarfile)
+        if "sha256" not in entry:
+            entry["sha256"] = hash_file(jarfile)
+            self.save()
+        return entry["sha256"]
+
+    def list_versions(self) -> List[str]:
+        self.refresh()
+        versions = set(self.versions)
+        if self.store is not None:
+            versions.update(self.store.versions())
+        return sorted(versions, key=version_key)
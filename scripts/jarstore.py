@@ -0,0 +1,149 @@
+import contextlib
+import hashlib
+import os
+import pathlib
+import time
+import zipfile
+from typing import List, Optional
+
+from jarindex import read_jar_metadata, version_in_filename
+from storage import locked_json, read_json
+
+
+STORE_FILENAME = "store.json"
+CHECKSUM_SUFFIXES = {".sha256": "sha256", ".sha1": "sha1"}
+
+
+class JarImport:
+    def __init__(self, source: pathlib.Path, digest: str, version: Optional[str], stored: bool):
+        self.source = source
+        self.digest = digest
+        self.version = version
+        self.stored = stored
+
+
+class JarStore:
+    def __init__(self, store_dir: pathlib.Path, encoding: str = "utf-8"):
+        self.store_dir = store_dir
+        self.store_file = store_dir / STORE_FILENAME
+        self.encoding = encoding
+        self.data = None
+        self.data_mtime_ns = None
+
+    def read(self) -> dict:
+        return read_json(self.store_file, {"jars": {}, "versions": {}}, self.encoding)
+
+    def mtime_ns(self) -> Optional[int]:
+        try:
+            return self.store_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> dict:
+        # Long running processes see imports of other processes, store.json is replaced by each of them
+        mtime_ns = self.mtime_ns()
+        if self.data is None or mtime_ns != self.data_mtime_ns:
+            self.data_mtime_ns = mtime_ns
+            self.data = self.read()
+        return self.data
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with locked_json(self.store_file, self.store_dir / "store.lock", {"jars": {}, "versions": {}},
+                         self.encoding) as data:
+            yield data
+        self.data = data
+        self.data_mtime_ns = self.mtime_ns()
+
+    def path(self, digest: str) -> pathlib.Path:
+        return self.store_dir / "sha256" / f"{digest}.jar"
+
+    def resolve(self, version: str) -> Optional[pathlib.Path]:
+        digest = self.load()["versions"].get(version)
+        return None if digest is None else self.path(digest)
+
+    def digest_of(self, jarfile: pathlib.Path) -> Optional[str]:
+        # Stored jars are named by their digest, which was verified when they were imported
+        if jarfile.parent != self.store_dir / "sha256":
+            return None
+        return jarfile.stem
+
+    def versions(self) -> List[str]:
+        return list(self.load()["versions"])
+
+    def import_jar(self, source: pathlib.Path, expected: Optional[str] = None) -> JarImport:
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        temporary = self.store_dir / f".import.{os.getpid()}.tmp"
+        sha256 = hashlib.sha256()
+        sha1 = hashlib.sha1()
+        try:
+            # Hash while copying, the source is read only once
+            with open(source, "rb") as reader, open(temporary, "wb") as writer:
+                for block in iter(lambda: reader.read(1024 * 1024), b""):
+                    sha256.update(block)
+                    sha1.update(block)
+                    writer.write(block)
+                writer.flush()
+                os.fsync(writer.fileno())
+            self.verify(source, temporary, {"sha256": sha256.hexdigest(), "sha1": sha1.hexdigest()}, expected)
+            digest = sha256.hexdigest()
+            metadata = read_jar_metadata(temporary)
+            # Mirrors name the directory after the version, like versions/1.12.2/server.jar
+            version = (metadata.get("id") or version_in_filename(source.name)
+                       or version_in_filename(source.parent.name))
+            with self.transaction() as data:
+                stored = digest not in data["jars"] or not self.path(digest).exists()
+                if stored:
+                    self.path(digest).parent.mkdir(exist_ok=True)
+                    os.chmod(temporary, 0o444)
+                    os.replace(temporary, self.path(digest))
+                entry = data["jars"].setdefault(digest, {"size": self.path(digest).stat().st_size,
+                                                         "imported": time.time(), "sources": []})
+                entry["version"] = version
+                entry["metadata"] = metadata
+                if source.name not in entry["sources"]:
+                    entry["sources"].append(source.name)
+                if version is not None:
+                    data["versions"][version] = digest
+            return JarImport(source, digest, version, stored)
+        finally:
+            if temporary.exists():
+                temporary.unlink()
+
+    # noinspection PyMethodMayBeStatic
+    def verify(self, source: pathlib.Path, copy: pathlib.Path, digests: dict, expected: Optional[str]):
+        checks = []
+        if expected is not None:
+            checks.append(("sha1" if len(expected) == 40 else "sha256", expected.lower()))
+        for suffix, algorithm in CHECKSUM_SUFFIXES.items():
+            sidecar = source.with_name(source.name + suffix)
+            if sidecar.exists():
+                checks.append((algorithm, sidecar.read_text().split()[0].lower()))
+        for algorithm, value in checks:
+            if digests[algorithm] != value:
+                raise ValueError(f"{source} has {algorithm} {digests[algorithm]}, expected {value}")
+        try:
+            with zipfile.ZipFile(copy) as archive:
+                broken = archive.testzip()
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"{source} is not a jar: {e}")
+        if broken is not None:
+            raise ValueError(f"{source} is corrupt at {broken}")
+
+    def import_paths(self, paths: List[pathlib.Path], expected: Optional[str] = None,
+                     remove: bool = False) -> List[JarImport]:
+        sources = []
+        for path in paths:
+            if path.is_dir():
+                sources.extend(sorted(path.rglob("*.jar")))
+            else:
+                sources.append(path)
+        imported = []
+        for source in sources:
+            imported.append(self.import_jar(source, expected))
+            if remove:
+                source.unlink()
+                for suffix in CHECKSUM_SUFFIXES:
+                    with contextlib.suppress(FileNotFoundError):
+                        source.with_name(source.name + suffix).unlink()
+        return imported
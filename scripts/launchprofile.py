@@ -0,0 +1,111 @@
+import pathlib
+import re
+from typing import List, Optional
+
+from procinfo import find_server_processes
+from storage import read_json, write_json_atomic
+
+
+PROFILE_FILENAME = "mcst-profile.json"
+AUTO = "auto"
+MIN_HEAP_MB = 512
+RESERVED_MB = 512
+# Metaspace, thread stacks, direct buffers and the code cache live outside the heap
+HEAP_SHARE = 0.75
+
+GC_FLAGS = {
+    "default": [],
+    "serial": ["-XX:+UseSerialGC"],
+    "parallel": ["-XX:+UseParallelGC"],
+    "g1": ["-XX:+UseG1GC"],
+    "shenandoah": ["-XX:+UseShenandoahGC"],
+    "zgc": ["-XX:+UnlockExperimentalVMOptions", "-XX:+UseZGC"],
+}
+
+TUNED_FLAGS = {
+    "none": [],
+    # Aikar's flags, the usual G1 tuning for Minecraft servers
+    "aikar": [
+        "-XX:+ParallelRefProcEnabled", "-XX:MaxGCPauseMillis=200", "-XX:+UnlockExperimentalVMOptions",
+        "-XX:+DisableExplicitGC", "-XX:+AlwaysPreTouch", "-XX:G1NewSizePercent=30", "-XX:G1MaxNewSizePercent=40",
+        "-XX:G1HeapRegionSize=8M", "-XX:G1ReservePercent=20", "-XX:G1HeapWastePercent=5",
+        "-XX:G1MixedGCCountTarget=4", "-XX:InitiatingHeapOccupancyPercent=15",
+        "-XX:G1MixedGCLiveThresholdPercent=90", "-XX:G1RSetUpdatingPauseTimePercent=5", "-XX:SurvivorRatio=32",
+        "-XX:+PerfDisableSharedMem", "-XX:MaxTenuringThreshold=1",
+    ],
+}
+
+PRESETS = {
+    "default": {"heap": "1024M", "gc": "default", "flags": "none", "extra_args": []},
+    "lobby": {"heap": "512M", "gc": "serial", "flags": "none", "extra_args": []},
+    "survival": {"heap": AUTO, "gc": "g1", "flags": "aikar", "extra_args": []},
+}
+
+
+def parse_size_mb(size: str) -> int:
+    match = re.fullmatch(r"(\d+)([KMGkmg]?)", size)
+    if match is None:
+        raise ValueError(f"Invalid heap size: {size}")
+    value, unit = int(match.group(1)), match.group(2).upper()
+    return {"K": value // 1024, "M": value, "G": value * 1024, "": value // (1024 * 1024)}[unit]
+
+
+def read_memory_limit_mb() -> Optional[int]:
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            content = pathlib.Path(path).read_text().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a number close to 2**63
+        if content.isdigit() and int(content) < 2 ** 60:
+            return int(content) // (1024 * 1024)
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+class LaunchProfile:
+    def __init__(self, directory: pathlib.Path, encoding: str = "utf-8"):
+        self.profile_file = directory / PROFILE_FILENAME
+        self.encoding = encoding
+        self.settings = dict(PRESETS["default"])
+        self.settings.update(read_json(self.profile_file, {}, encoding))
+
+    def update(self, preset: str = None, **values):
+        if preset is not None:
+            if preset not in PRESETS:
+                raise ValueError(f"Unknown preset: {preset}")
+            self.settings = dict(PRESETS[preset])
+        self.settings.update({key: value for key, value in values.items() if value is not None})
+        if self.settings["gc"] not in GC_FLAGS:
+            raise ValueError(f"Unknown garbage collector: {self.settings['gc']}")
+        if self.settings["flags"] not in TUNED_FLAGS:
+            raise ValueError(f"Unknown flag set: {self.settings['flags']}")
+        if self.settings["heap"] != AUTO:
+            parse_size_mb(self.settings["heap"])
+        write_json_atomic(self.profile_file, self.settings, self.encoding)
+
+    def heap_mb(self, servers_dir: pathlib.Path, name: str, planned: List[str] = ()) -> int:
+        if self.settings["heap"] != AUTO:
+            return parse_size_mb(self.settings["heap"])
+        limit = read_memory_limit_mb()
+        if limit is None:
+            return parse_size_mb(PRESETS["default"]["heap"])
+        # Servers started one after another must not each count only the ones before them
+        sharing = set(planned) | set(find_server_processes(servers_dir)) | {name}
+        share = (limit - RESERVED_MB) / len(sharing)
+        return max(MIN_HEAP_MB, int(share * HEAP_SHARE))
+
+    def jvm_args(self, servers_dir: pathlib.Path, name: str, planned: List[str] = ()) -> List[str]:
+        heap = self.heap_mb(servers_dir, name, planned)
+        # An automatic share is only a ceiling, committing it up front would add up past the limit
+        initial = [] if self.settings["heap"] == AUTO else [f"-Xms{heap}M"]
+        return ([f"-Xmx{heap}M"] + initial
+                + GC_FLAGS[self.settings["gc"]]
+                + TUNED_FLAGS[self.settings["flags"]]
+                + list(self.settings["extra_args"]))
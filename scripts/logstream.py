@@ -0,0 +1,185 @@
+import os
+import pathlib
+import re
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from storage import read_json, write_json_atomic
+
+
+MAX_LINE = 64 * 1024
+TAIL_BLOCK = 8192
+POLL_INTERVAL = 0.5
+SAVE_INTERVAL = 5.0
+LEVELS = {"TRACE": 5, "DEBUG": 10, "INFO": 20, "WARN": 30, "WARNING": 30, "ERROR": 40, "FATAL": 50, "CRITICAL": 50}
+MINECRAFT_LINE = re.compile(r"^\[(?P<time>[\d:]+)\] \[(?P<thread>[^\]]*)/(?P<level>[A-Z]+)\]: (?P<message>.*)$")
+MCST_LINE = re.compile(r"^(?P<level>[A-Z]+):(?P<logger>[^:]*):(?P<message>.*)$")
+
+
+def tail_offset(path: pathlib.Path, lines: int) -> int:
+    with open(path, "rb") as f:
+        end = position = f.seek(0, os.SEEK_END)
+        if lines <= 0:
+            return end
+        found = 0
+        while position > 0:
+            step = min(TAIL_BLOCK, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+            # The newline ending the last line does not start a new one
+            if position + step == end and block.endswith(b"\n"):
+                block = block[:-1]
+            for index in range(len(block) - 1, -1, -1):
+                if block[index] == 0x0A:
+                    found += 1
+                    if found == lines:
+                        return position + index + 1
+        return 0
+
+
+class LogSource:
+    def __init__(self, name: str, path: pathlib.Path, pattern: re.Pattern):
+        self.name = name
+        self.path = path
+        self.pattern = pattern
+        self.file = None
+        self.inode = None
+        self.offset = 0
+        self.level = "INFO"
+
+    def open(self, inode: Optional[int], offset: int):
+        try:
+            stat = self.path.stat()
+            self.file = open(self.path, "rb")
+        except OSError:
+            return
+        self.inode = stat.st_ino
+        self.offset = offset if inode == stat.st_ino and offset <= stat.st_size else 0
+        self.file.seek(self.offset)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read_lines(self) -> Iterator[str]:
+        while self.file is not None:
+            line = self.file.readline(MAX_LINE)
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                if len(line) < MAX_LINE:
+                    # Still being written, pick it up complete on the next poll
+                    self.file.seek(self.offset)
+                    break
+                # Overlong line, only the start is kept and the rest skipped
+                while True:
+                    rest = self.file.readline(MAX_LINE)
+                    if not rest or rest.endswith(b"\n"):
+                        break
+            self.offset = self.file.tell()
+            yield line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+    def poll(self) -> Iterator[str]:
+        if self.file is None:
+            self.open(None, 0)
+            yield from self.read_lines()
+            return
+        yield from self.read_lines()
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # Rotated or truncated, the old file was drained above
+            self.close()
+            self.open(None, 0)
+            yield from self.read_lines()
+
+    def parse(self, line: str) -> dict:
+        record = {"source": self.name, "line": line}
+        match = self.pattern.match(line)
+        if match is None:
+            # Continuation lines, like stack traces, belong to the previous record
+            record["level"] = self.level
+            record["message"] = line
+            return record
+        record.update(match.groupdict())
+        record["level"] = "WARNING" if record["level"] == "WARN" else record["level"]
+        self.level = record["level"]
+        return record
+
+
+class LogStream:
+    def __init__(self, discover: Callable[[], List[LogSource]], cursors_file: pathlib.Path,
+                 cursor: str = None, encoding: str = "utf-8"):
+        self.discover = discover
+        self.cursors_file = cursors_file
+        self.cursor = cursor
+        self.encoding = encoding
+        self.sources = {}
+
+    def load_positions(self) -> Dict[str, dict]:
+        if self.cursor is None:
+            return {}
+        return read_json(self.cursors_file, {}, self.encoding).get(self.cursor, {})
+
+    def save_positions(self):
+        if self.cursor is None:
+            return
+        cursors = read_json(self.cursors_file, {}, self.encoding)
+        cursors[self.cursor] = {f"{source.path}": {"inode": source.inode, "offset": source.offset}
+                                for source in self.sources.values() if source.inode is not None}
+        self.cursors_file.parent.mkdir(exist_ok=True)
+        write_json_atomic(self.cursors_file, cursors, self.encoding)
+
+    def add_sources(self, positions: Dict[str, dict], lines: int):
+        for source in self.discover():
+            if f"{source.path}" in self.sources:
+                continue
+            position = positions.get(f"{source.path}")
+            if position is not None:
+                source.open(position["inode"], position["offset"])
+            elif lines >= 0 and source.path.exists():
+                # A new cursor starts from the tail too, a whole log through docker exec can be huge
+                source.open(source.path.stat().st_ino, tail_offset(source.path, lines))
+            self.sources[f"{source.path}"] = source
+
+    def run(self, accept: Callable[[dict], bool], emit: Callable[[dict], None],
+            follow: bool = False, lines: int = 20):
+        self.add_sources(self.load_positions(), lines)
+        last_save = time.monotonic()
+        try:
+            while True:
+                for source in list(self.sources.values()):
+                    for line in source.poll():
+                        record = source.parse(line)
+                        if accept(record):
+                            emit(record)
+                if not follow:
+                    break
+                if time.monotonic() - last_save > SAVE_INTERVAL:
+                    self.save_positions()
+                    last_save = time.monotonic()
+                time.sleep(POLL_INTERVAL)
+                # Servers created while following start from their first line
+                self.add_sources({}, -1)
+        finally:
+            self.save_positions()
+            for source in self.sources.values():
+                source.close()
+
+
+def make_filter(servers: List[str], level: str, regex: str) -> Callable[[dict], bool]:
+    minimum = LEVELS[level.upper()] if level else 0
+    expression = re.compile(regex) if regex else None
+
+    def accept(record: dict) -> bool:
+        if servers and record["source"] not in servers:
+            return False
+        if LEVELS.get(record["level"], 0) < minimum:
+            return False
+        return expression is None or expression.search(record["line"]) is not None
+
+    return accept
@@ -1,43 +1,103 @@
 #!/usr/bin/python3
 
 import argparse
+import errno
+import json
 import sys
 import pathlib
 import os
 import logging
+import select
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import daemon
+from backupstore import BackupStore
+from cds import ClassDataSharing, startup_seconds
+from health import DEFAULT_PORT, DEFAULT_TIMEOUT, HealthProber
+from hibernate import Hibernator
+from console import ConsoleHost
+from catalog import INFO_FILENAME, ServerCatalog, read_server_port
+from jarindex import JarIndex
+from jarstore import JarStore
+from metrics import MetricsSampler
+from logstream import MCST_LINE, MINECRAFT_LINE, LogSource, LogStream, make_filter
+from launchprofile import GC_FLAGS, PRESETS, TUNED_FLAGS, LaunchProfile
+from procinfo import find_server_processes
+from properties import ServerProperties
+from rcon import RconPool, choose_port, new_password
+from storage import read_json, write_json_atomic, write_text_atomic
+from supervisor import Supervisor
+from usage import UsageTracker, format_size, parse_size
+from watcher import Watcher
+from worldcopy import WorldCopier
+from worldprune import PruneRules, WorldPruner, read_spawn
 
 
-# TODO Create backup: tar -c habo3t1/ >/jars/habo3b.tar
 # TODO remove server directory
-# TODO Restore backup: tar -x </jars/habo3b.tar
 
 
 DEFAULT_JAR = "server.jar"
+DEFAULT_SOCKET = "/tmp/mcst.sock"
+LOG_FILENAME = "mcst.log"
+
+
+class ServerLaunch:
+    def __init__(self, name: str, directory: pathlib.Path, jarfile: pathlib.Path, jar_digest: str,
+                 command: list, sharing: str):
+        self.name = name
+        self.directory = directory
+        self.jarfile = jarfile
+        self.jar_digest = jar_digest
+        self.command = command
+        self.sharing = sharing
+        self.started = time.time()
 
 
 class Mcst:
-    def __init__(self):
-        self.servers_dir = pathlib.Path("/servers")
-        self.jars_dir = pathlib.Path("/jars")
-        self.minecraft_server_command = 'pwd;/usr/bin/java -Xmx1024M -Xms1024M -jar "{jarfile}" {additional_args}'
+    def __init__(self, servers_dir: str = "/servers", jars_dir: str = "/jars", java_executable: str = "/usr/bin/java"):
+        self.servers_dir = pathlib.Path(servers_dir)
+        self.jars_dir = pathlib.Path(jars_dir)
+        self.java_executable = java_executable
         self.encoding = "utf-8"
+        self.server_output = None
+        self.jar_store = JarStore(self.jars_dir / "store", self.encoding)
+        self.jar_index = JarIndex(self.jars_dir, self.encoding, self.jar_store)
+        self.catalog = ServerCatalog(self.servers_dir, self.encoding)
+        self.usage_tracker = UsageTracker(self.servers_dir, self.catalog.state_dir, self.encoding)
+        self.backups = BackupStore(self.jars_dir / "backups", encoding=self.encoding)
+        self.class_data_sharing = ClassDataSharing(self.jars_dir / "cds", self.java_executable, self.encoding)
+        self.rcon_pool = RconPool()
 
-    def list(self):
-        subdirs = [subdir.name
-                   for subdir in self.get_server_directories()]
-        return "\n".join(subdirs)
+    def list(self, offset: int = 0, limit: int = None, match: str = None):
+        return "\n".join(self.list_page(offset, limit, match)["names"])
 
-    def get_server_directories(self):
-        return (subdir
-                for subdir in self.servers_dir.iterdir()
-                if subdir.is_dir())
+    def list_names(self):
+        return sorted(self.catalog.servers())
+
+    def list_page(self, offset: int = 0, limit: int = None, match: str = None) -> dict:
+        names = self.list_names()
+        if match:
+            folded = match.casefold()
+            names = [name for name in names if folded in name.casefold()]
+        end = None if limit is None else offset + limit
+        return {"names": names[offset:end], "offset": offset, "total": len(names)}
 
     def create(self, name: str):
         directory = self.servers_dir / name
         if directory.exists():
             raise FileExistsError()
         directory.mkdir()
+        self.catalog.update(name, created=time.time())
         self.start(name)
+        if (directory / "server.properties").exists():
+            self.configure_rcon(name)
+            self.update_port(name)
         self.log(f"Initialized {directory}")
 
     def settings_dump(self, name: str) -> str:
@@ -56,36 +116,183 @@ class Mcst:
         if directory.exists() is False:
             raise FileNotFoundError()
         server_properties = self.servers_dir / name / "server.properties"
-        server_properties.write_text(new_content, encoding=self.encoding)
+        write_text_atomic(server_properties, new_content, self.encoding)
+        self.update_port(name)
         self.log(f"Replaced settings in {server_properties}")
 
-    def start(self, name: str, jar: str = None, port: str = None):
-        if jar is None:
+    def update_port(self, name: str):
+        # The catalog port is what health probes, it follows server-port until a start overrides it
+        port = read_server_port(self.servers_dir / name, self.encoding)
+        if port is not None:
+            self.catalog.update(name, port=port)
+
+    def load_settings(self, name: str) -> ServerProperties:
+        server_properties = self.servers_dir / name / "server.properties"
+        if server_properties.exists() is False:
+            raise FileNotFoundError(f"{server_properties} does not exist")
+        return ServerProperties.load(server_properties, self.encoding)
+
+    def settings_get(self, name: str, keys: List[str] = None) -> Dict[str, str]:
+        settings = self.load_settings(name).items()
+        if not keys:
+            return settings
+        return {key: settings[key] for key in keys if key in settings}
+
+    def settings_patch(self, names: List[str], changes: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+        # Load everything first, so a missing server fails the call before any file is written
+        loaded = {name: self.load_settings(name) for name in names}
+        changed = {}
+        for name, settings in loaded.items():
+            changed[name] = settings.patch(changes)
+            if changed[name]:
+                settings.save(self.servers_dir / name / "server.properties", self.encoding)
+                if "server-port" in changed[name]:
+                    self.update_port(name)
+                self.log(f"Patched {', '.join(changed[name])} in settings of {name}")
+        return changed
+
+    def info(self, name: str) -> dict:
+        entry = self.catalog.servers().get(name)
+        if entry is None:
+            raise FileNotFoundError()
+        return entry
+
+    def update_info(self, name: str, **values):
+        info_file = self.servers_dir / name / INFO_FILENAME
+        info = read_json(info_file, {}, self.encoding)
+        info.update(values)
+        write_json_atomic(info_file, info, self.encoding)
+        self.catalog.update(name, **values)
+
+    def reconcile(self, full: bool = False):
+        self.catalog.reconcile(full)
+
+    def list_versions(self):
+        return self.jar_index.list_versions()
+
+    def import_jars(self, paths: List[str], checksum: str = None, remove: bool = False) -> List[dict]:
+        sources = [pathlib.Path(path) for path in paths] or [self.jars_dir / "drop"]
+        imported = []
+        for result in self.jar_store.import_paths(sources, checksum, remove):
+            self.log(f"{'Imported' if result.stored else 'Already stored'} {result.source}"
+                     f" as {result.digest} for version {result.version}")
+            imported.append({"source": f"{result.source}", "sha256": result.digest,
+                             "version": result.version, "stored": result.stored})
+        return imported
+
+    def start(self, name: str, jar: str = None, port: str = None, version: str = None, sharing: bool = True,
+              detach: bool = False):
+        launch = self.prepare_start(name, jar, port, version, sharing)
+        if detach:
+            ConsoleHost(self.console_socket(name), launch.command, launch.directory,
+                        on_exit=lambda: self.finish_start(launch)).spawn_detached()
+            self.log(f"Started {name} detached, attach to {self.console_socket(name)}")
+            return
+        # No os.chdir here, the daemon serves several clients from one process
+        subprocess.call(launch.command, cwd=launch.directory, stdout=self.server_output)
+        report = self.finish_start(launch)
+        if report is not None:
+            print(report, file=self.server_output or sys.stdout)
+
+    def prepare_start(self, name: str, jar: str = None, port: str = None, version: str = None,
+                      sharing: bool = True, planned: List[str] = None) -> ServerLaunch:
+        if jar is None and version is None:
             jar = DEFAULT_JAR
         directory = self.servers_dir / name
         additional_args = ["--nogui"]
         if port is not None:
-            additional_args.append(f"--port {port}")
-        additional_args_str = " ".join(additional_args)
+            additional_args.extend(["--port", f"{port}"])
         if directory.exists() is False:
             raise FileNotFoundError()
-        jarfile = self.jars_dir / jar
-        if jarfile.exists() is False:
-            raise FileNotFoundError()
+        self.check_quota(name, self.usage_tracker.refresh([name])[name])
+        if jar is None:
+            jarfile = self.jar_index.resolve(version)
+        else:
+            jarfile = self.jars_dir / jar
+            if jarfile.exists() is False:
+                raise FileNotFoundError()
+            version = self.jar_index.version_of(jar)
+        values = {"last_start": time.time()}
+        if port is not None:
+            values["port"] = int(port)
+        if version is not None:
+            values["last_server_version"] = version
+        self.update_info(name, **values)
         eula_txt = directory / "eula.txt"
         if eula_txt.exists():
             eula_content = eula_txt.read_text(self.encoding)
             if "eula=false" in eula_content:
                 eula_content = eula_content.replace("eula=false", "eula=true")
                 eula_txt.write_text(eula_content, encoding=self.encoding)
-        os.chdir(directory)
-        command = (self.minecraft_server_command
-                   .replace("{jarfile}", f"{jarfile}")
-                   .replace("{additional_args}", f"{additional_args_str}")
-                   )
-        os.system(command)
-
-    def clone(self, name: str, template: str):
+        # Without a planned set every server may end up running next to this one
+        planned = self.list_names() if planned is None else planned
+        jvm_args = LaunchProfile(directory, self.encoding).jvm_args(self.servers_dir, name, planned)
+        jar_digest = self.jar_index.digest(jarfile)
+        sharing_state = "off"
+        if sharing:
+            sharing_args, sharing_state = self.class_data_sharing.jvm_args(jar_digest)
+            jvm_args += sharing_args
+        command = [self.java_executable] + jvm_args + ["-jar", f"{jarfile}"] + additional_args
+        self.log(f"Starting {name} in {directory}: {command}")
+        return ServerLaunch(name, directory, jarfile, jar_digest, command, sharing_state)
+
+    def console_socket(self, name: str) -> pathlib.Path:
+        return self.catalog.state_dir / "consoles" / f"{name}.sock"
+
+    def attach(self, name: str):
+        socket_path = self.console_socket(name)
+        if socket_path.exists() is False:
+            raise FileNotFoundError(f"{name} is not running detached")
+        daemon.relay(f"{socket_path}")
+
+    def finish_start(self, launch: ServerLaunch):
+        self.usage_tracker.mark_dirty(launch.name)
+        if launch.sharing == "dumping":
+            self.class_data_sharing.after_exit(launch.jarfile, launch.jar_digest)
+        seconds = startup_seconds(launch.directory, launch.started)
+        if seconds is None:
+            return None
+        report = self.class_data_sharing.record_startup(launch.jar_digest, launch.sharing, seconds)
+        self.log(f"{launch.name}: {report}")
+        return report
+
+    def profile(self, name: str, preset: str = None, **values) -> dict:
+        directory = self.servers_dir / name
+        if directory.exists() is False:
+            raise FileNotFoundError()
+        profile = LaunchProfile(directory, self.encoding)
+        if preset is not None or any(value is not None for value in values.values()):
+            profile.update(preset, **values)
+            self.log(f"Updated launch profile of {name}: {profile.settings}")
+        return dict(profile.settings, jvm_args=profile.jvm_args(self.servers_dir, name, self.list_names()))
+
+    def log_sources(self, servers=None):
+        sources = []
+        if not servers or "mcst" in servers:
+            sources.append(LogSource("mcst", pathlib.Path(LOG_FILENAME).resolve(), MCST_LINE))
+        for name in self.list_names():
+            if not servers or name in servers:
+                sources.append(LogSource(name, self.servers_dir / name / "logs" / "latest.log", MINECRAFT_LINE))
+        return sources
+
+    def health(self, names: List[str] = None, timeout: float = DEFAULT_TIMEOUT) -> Dict[str, dict]:
+        servers = self.catalog.servers()
+        ports = {}
+        for name in names or sorted(servers):
+            if name not in servers:
+                raise FileNotFoundError(f"No server directory {name}")
+            ports[name] = (servers[name].get("port") or read_server_port(self.servers_dir / name, self.encoding)
+                           or DEFAULT_PORT)
+        running = list(find_server_processes(self.servers_dir))
+        return HealthProber(timeout=timeout).probe_all(ports, running)
+
+    def supervise(self, names):
+        Supervisor(self).run(names)
+
+    def hibernate(self, names, idle_minutes: float):
+        Hibernator(self, idle_minutes * 60).run(names)
+
+    def clone(self, name: str, template: str, with_world: bool = False):
         if template is None:
             template = self.get_a_random_name()
             if template is None:
@@ -98,20 +305,276 @@ class Mcst:
         source_dir = self.servers_dir / template
         if source_dir.exists() is False:
             raise FileNotFoundError()
-        target_dir.mkdir()
-        for filename in ["eula.txt", "server.properties"]:
-            (target_dir / filename).write_bytes((source_dir / filename).read_bytes())
+        if with_world:
+            busy = list(find_server_processes(self.servers_dir))
+            if template in busy:
+                raise RuntimeError(f"{template} is running, stop it before copying its world")
+            self.check_quota(name, self.usage_tracker.refresh([template], busy)[template])
+            started = time.monotonic()
+            try:
+                WorldCopier(progress=self.report_copy_progress).copy_tree(source_dir, target_dir)
+            except BaseException:
+                # A half copied directory would be cataloged as a server by the next reconcile
+                shutil.rmtree(target_dir, ignore_errors=True)
+                raise
+            self.log(f"Copied {source_dir} to {target_dir} in {time.monotonic() - started:.1f}s")
+        else:
+            target_dir.mkdir()
+            for filename in ["eula.txt", "server.properties"]:
+                (target_dir / filename).write_bytes((source_dir / filename).read_bytes())
+        self.catalog.update(name, created=time.time(), **{
+            key: value
+            for key, value in self.catalog.servers().get(template, {}).items()
+            if key in ("last_server_version", "port")
+        })
+        # The copied RCON port and password belong to the template
+        self.configure_rcon(name, renew_password=True)
+        self.update_port(name)
         self.log(f"Initialized {target_dir} from {template}")
 
+    def configure_rcon(self, name: str, renew_password: bool = False) -> int:
+        used = {}
+        for other in self.list_names():
+            try:
+                used[other] = int(self.load_settings(other).get("rcon.port") or "")
+            except (FileNotFoundError, ValueError):
+                pass
+        settings = self.load_settings(name)
+        try:
+            current = int(settings.get("rcon.port") or "")
+        except ValueError:
+            current = None
+        port = choose_port(used, name, current)
+        password = settings.get("rcon.password")
+        changes = {"enable-rcon": "true", "rcon.port": f"{port}"}
+        if renew_password or not password:
+            changes["rcon.password"] = new_password()
+        if settings.patch(changes):
+            settings.save(self.servers_dir / name / "server.properties", self.encoding)
+            self.log(f"Enabled RCON of {name} on port {port}")
+        return port
+
+    def rcon_enabled(self) -> List[str]:
+        names = []
+        for name in self.list_names():
+            try:
+                if self.load_settings(name).get("enable-rcon") == "true":
+                    names.append(name)
+            except FileNotFoundError:
+                pass
+        return names
+
+    def rcon_settings(self, name: str) -> Tuple[int, str]:
+        settings = self.load_settings(name)
+        if settings.get("enable-rcon") != "true" or not settings.get("rcon.password"):
+            raise ValueError(f"RCON is not enabled for {name}, see rcon-enable")
+        return int(settings.get("rcon.port") or "25575"), settings.get("rcon.password")
+
+    def rcon(self, names: List[str], commands: List[str], pipeline: bool = False) -> Dict[str, dict]:
+        def run(name: str) -> dict:
+            try:
+                port, password = self.rcon_settings(name)
+                return {"responses": self.rcon_pool.execute(name, port, password, commands, pipeline)}
+            except (OSError, ValueError) as e:
+                return {"error": f"{e}"}
+
+        # Each server has its own pooled session, they are talked to side by side
+        with ThreadPoolExecutor(max_workers=max(1, min(32, len(names)))) as executor:
+            results = dict(zip(names, executor.map(run, names)))
+        for name, result in results.items():
+            if "error" in result:
+                self.log(f"RCON to {name} failed: {result['error']}")
+        return results
+
+    def usage(self, names: List[str] = None, full: bool = False) -> Dict[str, dict]:
+        busy = list(find_server_processes(self.servers_dir))
+        sizes = self.usage_tracker.refresh(names, busy, full)
+        quotas = self.usage_tracker.quotas()
+        usage = {}
+        for name, size in sizes.items():
+            quota = self.usage_tracker.quota_of(name, quotas)
+            state = "ok"
+            if quota.get("hard") is not None and size > quota["hard"]:
+                state = "hard"
+            elif quota.get("soft") is not None and size > quota["soft"]:
+                state = "soft"
+            usage[name] = {"size": size, "soft": quota.get("soft"), "hard": quota.get("hard"),
+                           "state": state, "running": name in busy}
+        with self.catalog.transaction() as data:
+            for name, size in sizes.items():
+                if name in data["servers"]:
+                    data["servers"][name]["size"] = size
+        return usage
+
+    def set_quota(self, name: Optional[str], soft: str = None, hard: str = None):
+        if name is not None and (self.servers_dir / name).exists() is False:
+            raise FileNotFoundError()
+        quotas = self.usage_tracker.quotas()
+        quota = dict(quotas["default"] if name is None else quotas["servers"].get(name, {}))
+        # An omitted limit stays as it is, none clears it and default follows the default quota again
+        for key, value in (("soft", soft), ("hard", hard)):
+            if value is None:
+                continue
+            if value.lower() == "default":
+                quota.pop(key, None)
+            else:
+                quota[key] = parse_size(value)
+        self.usage_tracker.set_quota(name, quota)
+        effective = self.usage_tracker.quota_of(name)
+        self.log(f"Quota of {name or 'every server'} set to soft {format_size(effective.get('soft'))}"
+                 f" and hard {format_size(effective.get('hard'))}")
+
+    def check_quota(self, name: str, size: int):
+        quota = self.usage_tracker.quota_of(name)
+        if quota.get("hard") is not None and size > quota["hard"]:
+            raise OSError(errno.EDQUOT, f"{name} needs {format_size(size)},"
+                                        f" above its hard quota of {format_size(quota['hard'])}")
+        if quota.get("soft") is not None and size > quota["soft"]:
+            message = f"{name} uses {format_size(size)}, above its soft quota of {format_size(quota['soft'])}"
+            self.log(message)
+            print(message, file=sys.stderr)
+
+    def world_prune(self, name: str, rules: PruneRules, center: str = None, dry_run: bool = False,
+                    workers: int = None) -> dict:
+        directory = self.servers_dir / name
+        if directory.exists() is False:
+            raise FileNotFoundError()
+        if name in find_server_processes(self.servers_dir):
+            raise RuntimeError(f"{name} is running, stop it before pruning its world")
+        settings = self.load_settings(name) if (directory / "server.properties").exists() else ServerProperties([])
+        world = directory / (settings.get("level-name") or "world")
+        if world.exists() is False:
+            raise FileNotFoundError(f"{world} does not exist")
+        if center is None:
+            rules.center = read_spawn(world)
+        else:
+            rules.center = tuple(int(value) for value in center.split(","))
+        summary = WorldPruner(rules, workers).prune(world, dry_run)
+        if not dry_run:
+            self.usage_tracker.mark_dirty(name)
+            self.log(f"Pruned {summary['dropped']} of {summary['chunks']} chunks in {world},"
+                     f" reclaimed {summary['reclaimed']} bytes")
+        return summary
+
+    def backup(self, name: str) -> dict:
+        directory = self.servers_dir / name
+        if directory.exists() is False:
+            raise FileNotFoundError()
+        manifest = self.backups.backup(name, directory)
+        self.log(f"Backed up {directory} as {manifest['id']}, {manifest['stored_bytes']} new bytes stored")
+        return manifest
+
+    def restore(self, name: str, snapshot: str = None, target: str = None):
+        target_dir = self.servers_dir / (target or name)
+        manifest = self.backups.restore(name, snapshot, target_dir)
+        if target not in (None, name) and (target_dir / "server.properties").exists():
+            # Like a clone, the copy must not share the RCON port and password of its source
+            self.configure_rcon(target, renew_password=True)
+            self.update_port(target)
+        self.log(f"Restored {name} snapshot {manifest['id']} to {target_dir}")
+
+    def list_backups(self, name: str):
+        return self.backups.snapshots(name)
+
+    def prune_backups(self, name: str, keep: int):
+        removed, freed = self.backups.prune(name, keep)
+        self.log(f"Pruned {len(removed)} snapshots of {name}, freed {freed} bytes")
+        return removed, freed
+
+    # noinspection PyMethodMayBeStatic
+    def report_copy_progress(self, copied: int, total: int):
+        print(f"Copied {copied // 2**20} of {total // 2**20} MiB", file=sys.stderr, flush=True)
+
     def get_a_random_name(self):
-        for subdir in self.get_server_directories():
-            return subdir.name
+        for name in self.catalog.servers():
+            return name
 
     # noinspection PyMethodMayBeStatic
     def log(self, message):
         logging.info(message)
 
 
+class OperationsHandler:
+    def __init__(self, mcst: Mcst):
+        self.mcst = mcst
+        self.operations = {
+            "list": self.list_op,
+            "list-page": self.list_page_op,
+            "create": self.create_op,
+            "settings-show": self.settings_show_op,
+            "settings-replace": self.settings_replace_op,
+            "settings-get": self.settings_get_op,
+            "settings-patch": self.settings_patch_op,
+            "clone": self.clone_op,
+            "info": self.info_op,
+            "list-versions": self.list_versions_op,
+            "health": self.health_op,
+            "rcon": self.rcon_op,
+        }
+        # Only read files and talk to the servers, the daemon runs them next to the others
+        self.concurrent = {"health", "rcon"}
+
+    def execute(self, request: dict) -> dict:
+        response = {}
+        # Any JSON value can arrive, only an object is a request
+        op = request.get("op") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError(f"A request must be a JSON object, not {type(request).__name__}")
+            if "id" in request:
+                response["id"] = request["id"]
+            args = request.get("args", {})
+            if not isinstance(args, dict):
+                raise ValueError(f"The args of a request must be a JSON object, not {type(args).__name__}")
+            operation = self.operations.get(op)
+            if operation is None:
+                raise ValueError(f"Unknown operation: {op}")
+            response["result"] = operation(**args)
+            response["ok"] = True
+        except Exception as e:
+            self.mcst.log(f"Operation {op} failed: {e!r}")
+            response["ok"] = False
+            response["error"] = type(e).__name__
+            response["message"] = str(e)
+        return response
+
+    def list_op(self):
+        return self.mcst.list_names()
+
+    def list_page_op(self, offset: int = 0, limit: int = None, match: str = None):
+        return self.mcst.list_page(offset, limit, match)
+
+    def create_op(self, name: str):
+        self.mcst.create(name)
+
+    def settings_show_op(self, name: str):
+        return self.mcst.settings_dump(name)
+
+    def settings_replace_op(self, name: str, content: str):
+        self.mcst.settings_replace(name, content)
+
+    def settings_get_op(self, name: str, keys: list = None):
+        return self.mcst.settings_get(name, keys)
+
+    def settings_patch_op(self, names: list, changes: dict):
+        return self.mcst.settings_patch(names, changes)
+
+    def clone_op(self, name: str, template: str = None, with_world: bool = False):
+        self.mcst.clone(name, template, with_world)
+
+    def info_op(self, name: str):
+        return self.mcst.info(name)
+
+    def health_op(self, names: list = None, timeout: float = DEFAULT_TIMEOUT):
+        return self.mcst.health(names, timeout)
+
+    def rcon_op(self, names: list, commands: list, pipeline: bool = False):
+        return self.mcst.rcon(names, commands, pipeline)
+
+    def list_versions_op(self):
+        return self.mcst.list_versions()
+
+
 class ArgumentsHandler:
     def __init__(self, mcst: Mcst):
         self.mcst = mcst
@@ -121,6 +584,11 @@ class ArgumentsHandler:
         subparsers = parser.add_subparsers()
 
         parser_list = subparsers.add_parser("list", help="List server directories")
+        parser_list.add_argument("--offset", type=int, default=0, help="Skip this many directories")
+        parser_list.add_argument("--limit", type=int, help="List at most this many directories")
+        parser_list.add_argument("--match", type=str, help="Only directories containing this, ignoring case")
+        parser_list.add_argument("--json", action="store_true", help="Write the page and the total count as JSON")
+        parser_list.add_argument("--sizes", action="store_true", help="Show the disk usage of each directory")
         parser_list.set_defaults(func=self.list_func)
 
         parser_create = subparsers.add_parser("create", help="Initialize a new server directory")
@@ -137,24 +605,225 @@ class ArgumentsHandler:
         parser_settings_replace.add_argument("name", type=str, help="Server directory name")
         parser_settings_replace.set_defaults(func=self.settings_replace_func)
 
+        parser_settings_get = subparsers.add_parser("settings-get",
+                                                    help="Write selected settings of a server directory to stdout")
+        parser_settings_get.add_argument("name", type=str, help="Server directory name")
+        parser_settings_get.add_argument("keys", type=str, nargs="*", help="Setting keys, all of them if omitted")
+        parser_settings_get.add_argument("--json", action="store_true", help="Write a JSON object")
+        parser_settings_get.set_defaults(func=self.settings_get_func)
+
+        parser_settings_patch = subparsers.add_parser("settings-patch",
+                                                      help="Change single settings of one or more server directories,"
+                                                           " from a JSON object on stdin unless --set/--unset is given")
+        parser_settings_patch.add_argument("names", type=str, nargs="+", help="Server directory names")
+        parser_settings_patch.add_argument("--set", type=str, action="append", default=[], metavar="KEY=VALUE",
+                                           help="Setting to change or add")
+        parser_settings_patch.add_argument("--unset", type=str, action="append", default=[], metavar="KEY",
+                                           help="Setting to remove")
+        parser_settings_patch.set_defaults(func=self.settings_patch_func)
+
         parser_start = subparsers.add_parser("start", help="Start server - will stay interactive")
         parser_start.add_argument("name", type=str, help="Server directory name")
         parser_start.add_argument("--jar", type=str, help="jar file to use from the jars directory",
                                   default=None)
         parser_start.add_argument("--port", type=int, help="Port to use, overrides server.properties",
                                   default=None)
+        parser_start.add_argument("--mcversion", type=str, help="Minecraft version to start, picks the jar",
+                                  default=None)
+        parser_start.add_argument("--detach", action="store_true",
+                                  help="Run in the background under a console that attach can connect to")
+        parser_start.add_argument("--no-cds", action="store_true", help="Do not use or create a class data archive")
         parser_start.set_defaults(func=self.start_func)
 
+        parser_attach = subparsers.add_parser("attach",
+                                              help="Connect to the console of a detached server, end input to detach")
+        parser_attach.add_argument("name", type=str, help="Server directory name")
+        parser_attach.set_defaults(func=self.attach_func)
+
+        parser_profile = subparsers.add_parser("profile", help="Show or change the JVM launch profile of a server")
+        parser_profile.add_argument("name", type=str, help="Server directory name")
+        parser_profile.add_argument("--preset", type=str, choices=sorted(PRESETS), help="Start from a preset",
+                                    default=None)
+        parser_profile.add_argument("--heap", type=str, help="Heap size like 2G, or auto to share the memory limit",
+                                    default=None)
+        parser_profile.add_argument("--gc", type=str, choices=sorted(GC_FLAGS), help="Garbage collector",
+                                    default=None)
+        parser_profile.add_argument("--flags", type=str, choices=sorted(TUNED_FLAGS), help="Tuned flag set",
+                                    default=None)
+        parser_profile.add_argument("--extra-args", type=str, nargs="*", help="Additional JVM arguments",
+                                    default=None)
+        parser_profile.set_defaults(func=self.profile_func)
+
+        parser_supervise = subparsers.add_parser("supervise",
+                                                 help="Run several servers in the background, restarting crashed ones")
+        parser_supervise.add_argument("names", type=str, nargs="*", help="Server directory names")
+        parser_supervise.add_argument("--all", action="store_true", help="Run every server directory")
+        parser_supervise.set_defaults(func=self.supervise_func)
+
+        parser_health = subparsers.add_parser("health", help="Probe every server port at once with Server List Ping")
+        parser_health.add_argument("names", type=str, nargs="*",
+                                   help="Server directory names, all of them by default")
+        parser_health.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                                   help="Seconds to wait for a server")
+        parser_health.add_argument("--json", action="store_true", help="Write the results as JSON")
+        parser_health.set_defaults(func=self.health_func)
+
+        parser_rcon = subparsers.add_parser("rcon", help="Run console commands on running servers through RCON")
+        parser_rcon.add_argument("words", type=str, nargs="+",
+                                 help="Server directory name and the commands, or only the commands with --all")
+        parser_rcon.add_argument("--all", action="store_true", help="Run the commands on every server, in parallel")
+        parser_rcon.add_argument("--pipeline", action="store_true",
+                                 help="Send all commands in one write, vanilla servers read only one at a time")
+        parser_rcon.add_argument("--json", action="store_true", help="Write the responses as JSON")
+        parser_rcon.set_defaults(func=self.rcon_func)
+
+        parser_rcon_enable = subparsers.add_parser("rcon-enable", help="Enable RCON with a unique port and a random"
+                                                                       " password, create and clone do this")
+        parser_rcon_enable.add_argument("names", type=str, nargs="*", help="Server directory names")
+        parser_rcon_enable.add_argument("--all", action="store_true", help="Enable it for every server directory")
+        parser_rcon_enable.set_defaults(func=self.rcon_enable_func)
+
+        parser_hibernate = subparsers.add_parser("hibernate", help="Keep servers stopped until somebody joins,"
+                                                                   " stop them again when nobody plays")
+        parser_hibernate.add_argument("names", type=str, nargs="*", help="Server directory names")
+        parser_hibernate.add_argument("--all", action="store_true", help="Hibernate every server directory")
+        parser_hibernate.add_argument("--idle-minutes", type=float, default=10,
+                                      help="Stop a server after this long without players")
+        parser_hibernate.set_defaults(func=self.hibernate_func)
+
         parser_clone = subparsers.add_parser("clone", help="Initialize a new server directory based on another")
         parser_clone.add_argument("name", type=str, help="New server directory name")
         parser_clone.add_argument("--template", type=str, help="Server directory to use as template", default=None)
+        parser_clone.add_argument("--with-world", action="store_true",
+                                  help="Copy the whole directory including the world, not just the settings")
         parser_clone.set_defaults(func=self.clone_func)
 
+        parser_info = subparsers.add_parser("info", help="Write information about a server directory as JSON")
+        parser_info.add_argument("name", type=str, help="Server directory name")
+        parser_info.set_defaults(func=self.info_func)
+
+        parser_list_versions = subparsers.add_parser("list-versions", help="List versions of the available jars")
+        parser_list_versions.set_defaults(func=self.list_versions_func)
+
+        parser_jar_import = subparsers.add_parser("jar-import", help="Verify jars and add them to the jar store,"
+                                                                     " stored once by their SHA-256")
+        parser_jar_import.add_argument("paths", type=str, nargs="*",
+                                       help="Jars or directories to import, the drop directory in the jars"
+                                            " directory if omitted")
+        parser_jar_import.add_argument("--checksum", type=str, help="Expected SHA-256 or SHA-1 of the jars")
+        parser_jar_import.add_argument("--remove", action="store_true", help="Delete the sources once imported")
+        parser_jar_import.set_defaults(func=self.jar_import_func)
+
+        parser_reconcile = subparsers.add_parser("reconcile", help="Repair the server catalog from the directories")
+        parser_reconcile.add_argument("--full", action="store_true", help="Rescan every server, not just new ones")
+        parser_reconcile.set_defaults(func=self.reconcile_func)
+
+        parser_usage = subparsers.add_parser("usage", help="Show the disk usage of server directories and their quotas,"
+                                                           " only changed directories are walked again")
+        parser_usage.add_argument("names", type=str, nargs="*", help="Server directory names, all of them if omitted")
+        parser_usage.add_argument("--full", action="store_true", help="Walk every file again")
+        parser_usage.add_argument("--json", action="store_true", help="Write a JSON object")
+        parser_usage.set_defaults(func=self.usage_func)
+
+        parser_quota = subparsers.add_parser("quota", help="Set the disk quotas enforced by start and clone")
+        parser_quota.add_argument("name", type=str, nargs="?", help="Server directory name, the default if omitted")
+        parser_quota.add_argument("--soft", type=str,
+                                  help="Warn above this size, like 5G; none for no limit, default to use the default")
+        parser_quota.add_argument("--hard", type=str,
+                                  help="Refuse start and clone above this size; none for no limit,"
+                                       " default to use the default")
+        parser_quota.set_defaults(func=self.quota_func)
+
+        parser_world_prune = subparsers.add_parser("world-prune", help="Drop unused chunks from the world of a stopped"
+                                                                       " server and compact its region files")
+        parser_world_prune.add_argument("name", type=str, help="Server directory name")
+        parser_world_prune.add_argument("--min-inhabited", type=int, metavar="TICKS",
+                                        help="Drop chunks players spent less time in, 20 ticks are a second")
+        parser_world_prune.add_argument("--max-radius", type=int, metavar="BLOCKS",
+                                        help="Drop chunks farther from the center")
+        parser_world_prune.add_argument("--keep-radius", type=int, metavar="BLOCKS",
+                                        help="Keep chunks this close to the center, whatever their inhabited time")
+        parser_world_prune.add_argument("--center", type=str, metavar="X,Z",
+                                        help="Center in block coordinates, the world spawn by default")
+        parser_world_prune.add_argument("--dry-run", action="store_true", help="Only report what would be reclaimed")
+        parser_world_prune.add_argument("--workers", type=int, help="Processes to use, one per CPU by default")
+        parser_world_prune.set_defaults(func=self.world_prune_func)
+
+        parser_backup = subparsers.add_parser("backup", help="Store an incremental snapshot of a server directory")
+        parser_backup.add_argument("name", type=str, help="Server directory name")
+        parser_backup.set_defaults(func=self.backup_func)
+
+        parser_backups = subparsers.add_parser("backup-list", help="List snapshots of a server directory")
+        parser_backups.add_argument("name", type=str, help="Server directory name")
+        parser_backups.set_defaults(func=self.backup_list_func)
+
+        parser_prune = subparsers.add_parser("backup-prune", help="Drop old snapshots and the data only they used")
+        parser_prune.add_argument("name", type=str, help="Server directory name")
+        parser_prune.add_argument("--keep", type=int, help="Number of recent snapshots to keep", default=5)
+        parser_prune.set_defaults(func=self.backup_prune_func)
+
+        parser_restore = subparsers.add_parser("restore", help="Restore a snapshot into a new server directory")
+        parser_restore.add_argument("name", type=str, help="Server directory name the snapshot was taken of")
+        parser_restore.add_argument("--snapshot", type=str, help="Snapshot to restore, the latest by default",
+                                    default=None)
+        parser_restore.add_argument("--target", type=str, help="Directory to restore into, the original by default",
+                                    default=None)
+        parser_restore.set_defaults(func=self.restore_func)
+
+        parser_stats = subparsers.add_parser("stats", help="Show CPU, memory, thread and file usage of running servers")
+        parser_stats.add_argument("--interval", type=float, help="Seconds between samples", default=1.0)
+        parser_stats.add_argument("--samples", type=int, help="Number of samples to summarize", default=5)
+        parser_stats.add_argument("--prometheus", type=str, help="Keep writing Prometheus text to this file",
+                                  default=None)
+        parser_stats.add_argument("--serve", type=int, help="Keep serving Prometheus text on this port at /metrics",
+                                  default=None)
+        parser_stats.set_defaults(func=self.stats_func)
+
+        parser_logs = subparsers.add_parser("logs", help="Show mcst.log and the logs of the servers")
+        parser_logs.add_argument("--server", type=str, action="append", default=[],
+                                 help="Only this server, mcst for mcst.log itself; can be repeated")
+        parser_logs.add_argument("--level", type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR", "FATAL"],
+                                 help="Minimum level", default=None)
+        parser_logs.add_argument("--grep", type=str, help="Only lines matching this regular expression", default=None)
+        parser_logs.add_argument("--lines", type=int, help="Lines to show from the end of each log", default=20)
+        parser_logs.add_argument("--resume", type=str, metavar="CURSOR", default=None,
+                                 help="Continue where the last run with this cursor stopped")
+        parser_logs.add_argument("--follow", "-f", action="store_true", help="Keep streaming new lines")
+        parser_logs.add_argument("--json", action="store_true", help="Write one JSON record per line")
+        parser_logs.set_defaults(func=self.logs_func)
+
+        parser_watch = subparsers.add_parser("watch", help="Stream changes of server directories and their settings"
+                                                           " as one JSON event per line")
+        parser_watch.add_argument("--poll", action="store_true", help="Poll instead of using inotify")
+        parser_watch.set_defaults(func=self.watch_func)
+
+        parser_batch = subparsers.add_parser("batch", help="Run newline delimited JSON commands from stdin")
+        parser_batch.set_defaults(func=self.batch_func)
+
+        parser_serve = subparsers.add_parser("serve", help="Run as a daemon, serving operations on a unix socket")
+        parser_serve.add_argument("--socket", type=str, help="Socket path", default=DEFAULT_SOCKET)
+        parser_serve.set_defaults(func=self.serve_func)
+
+        parser_connect = subparsers.add_parser("connect", help="Relay stdin/stdout to a running daemon")
+        parser_connect.add_argument("--socket", type=str, help="Socket path", default=DEFAULT_SOCKET)
+        parser_connect.set_defaults(func=self.connect_func)
+
         parsed = parser.parse_args(args)
         parsed.func(parsed)
 
     def list_func(self, args):
-        print(self.mcst.list())
+        if args.sizes:
+            page = self.mcst.list_page(args.offset, args.limit, args.match)
+            usage = self.mcst.usage(page["names"])
+            if args.json:
+                print(json.dumps(dict(page, sizes={name: usage[name]["size"] for name in page["names"]})))
+            else:
+                for name in page["names"]:
+                    print(f"{name}\t{format_size(usage[name]['size'])}")
+        elif args.json:
+            print(json.dumps(self.mcst.list_page(args.offset, args.limit, args.match)))
+        else:
+            print(self.mcst.list(args.offset, args.limit, args.match))
 
     def create_func(self, args):
         # TODO This should also have a jar argument
@@ -167,16 +836,229 @@ class ArgumentsHandler:
         new_content = sys.stdin.read()
         self.mcst.settings_replace(args.name, new_content)
 
+    def settings_get_func(self, args):
+        settings = self.mcst.settings_get(args.name, args.keys)
+        if args.json:
+            print(json.dumps(settings))
+            return
+        for key, value in settings.items():
+            print(f"{key}={value}")
+
+    def settings_patch_func(self, args):
+        if args.set or args.unset:
+            changes = {}
+            for item in args.set:
+                if "=" not in item:
+                    raise ValueError(f"--set needs KEY=VALUE, got {item}")
+                key, value = item.split("=", 1)
+                changes[key] = value
+            changes.update({key: None for key in args.unset})
+        else:
+            changes = json.loads(sys.stdin.read())
+        print(json.dumps(self.mcst.settings_patch(args.names, changes)))
+
     def start_func(self, args):
-        self.mcst.start(args.name, args.jar, args.port)
+        self.mcst.start(args.name, args.jar, args.port, args.mcversion, not args.no_cds, args.detach)
+
+    def attach_func(self, args):
+        self.mcst.attach(args.name)
+
+    def profile_func(self, args):
+        print(json.dumps(self.mcst.profile(args.name, args.preset, heap=args.heap, gc=args.gc, flags=args.flags,
+                                           extra_args=args.extra_args), indent=1))
+
+    def supervise_func(self, args):
+        self.mcst.supervise(self.mcst.list_names() if args.all else args.names)
+
+    def health_func(self, args):
+        health = self.mcst.health(args.names, args.timeout)
+        if args.json:
+            print(json.dumps(health))
+            return
+        print(f"{'SERVER':<20} {'PORT':>5} {'STATE':<9} {'MS':>7} {'PLAYERS':>7} {'VERSION':<12} MOTD")
+        for name, result in health.items():
+            latency = f"{result['latency_ms']:.1f}" if "latency_ms" in result else "-"
+            players = f"{result['online']}/{result['max']}" if result.get("online") is not None else "-"
+            print(f"{name:<20} {result['port']:>5} {result['state']:<9} {latency:>7} {players:>7}"
+                  f" {result.get('version') or '-':<12} {result.get('motd') or result.get('error', '')}")
+
+    def rcon_func(self, args):
+        if args.all:
+            names, commands = self.mcst.rcon_enabled(), args.words
+        else:
+            names, commands = args.words[:1], args.words[1:]
+        if not commands:
+            raise ValueError("No command given")
+        results = self.mcst.rcon(names, commands, args.pipeline)
+        if args.json:
+            print(json.dumps(results))
+            return
+        for name, result in results.items():
+            prefix = f"{name}: " if args.all else ""
+            if "error" in result:
+                print(f"{prefix}{result['error']}", file=sys.stderr)
+                continue
+            for response in result["responses"]:
+                for line in response.splitlines() or [""]:
+                    print(f"{prefix}{line}")
+
+    def rcon_enable_func(self, args):
+        for name in self.mcst.list_names() if args.all else args.names:
+            print(f"{name}: RCON on port {self.mcst.configure_rcon(name)}")
+
+    def hibernate_func(self, args):
+        self.mcst.hibernate(self.mcst.list_names() if args.all else args.names, args.idle_minutes)
 
     def clone_func(self, args):
-        self.mcst.clone(args.name, args.template)
+        self.mcst.clone(args.name, args.template, args.with_world)
+
+    def info_func(self, args):
+        print(json.dumps(self.mcst.info(args.name)))
+
+    def list_versions_func(self, args):
+        print("\n".join(self.mcst.list_versions()))
+
+    def jar_import_func(self, args):
+        for result in self.mcst.import_jars(args.paths, args.checksum, args.remove):
+            state = "imported" if result["stored"] else "already stored"
+            print(f"{result['source']}: {state} as {result['sha256'][:16]} for version {result['version']}")
+
+    def reconcile_func(self, args):
+        self.mcst.reconcile(args.full)
+
+    def usage_func(self, args):
+        usage = self.mcst.usage(args.names, args.full)
+        if args.json:
+            print(json.dumps(usage))
+            return
+        for name, entry in usage.items():
+            state = {"ok": "", "soft": "above soft quota", "hard": "above hard quota"}[entry["state"]]
+            print(f"{name:<24} {format_size(entry['size']):>10}  soft {format_size(entry['soft']):>10}"
+                  f"  hard {format_size(entry['hard']):>10}  {'running ' if entry['running'] else ''}{state}")
+
+    def quota_func(self, args):
+        self.mcst.set_quota(args.name, args.soft, args.hard)
+
+    def world_prune_func(self, args):
+        rules = PruneRules(args.min_inhabited, args.max_radius, args.keep_radius)
+        summary = self.mcst.world_prune(args.name, rules, args.center, args.dry_run, args.workers)
+        print(f"{'Would drop' if summary['dry_run'] else 'Dropped'} {summary['dropped']} of {summary['chunks']}"
+              f" chunks in {summary['regions']} region files,"
+              f" {format_size(summary['before'])} -> {format_size(summary['after'])},"
+              f" {'would reclaim' if summary['dry_run'] else 'reclaimed'} {format_size(summary['reclaimed'])}")
+
+    def backup_func(self, args):
+        print(self.mcst.backup(args.name)["id"])
+
+    def backup_list_func(self, args):
+        print("\n".join(self.mcst.list_backups(args.name)))
+
+    def backup_prune_func(self, args):
+        removed, freed = self.mcst.prune_backups(args.name, args.keep)
+        print(f"Removed {len(removed)} snapshots, freed {freed} bytes")
+
+    def restore_func(self, args):
+        self.mcst.restore(args.name, args.snapshot, args.target)
+
+    def stats_func(self, args):
+        sampler = MetricsSampler(self.mcst.servers_dir)
+        if args.serve is not None or args.prometheus is not None:
+            if args.serve is not None:
+                sampler.serve(args.serve)
+            prometheus_file = pathlib.Path(args.prometheus) if args.prometheus else None
+            sampler.run(args.interval, threading.Event(), prometheus_file)
+            return
+        for remaining in range(args.samples - 1, -1, -1):
+            sampler.sample()
+            if remaining:
+                time.sleep(args.interval)
+        print(f"{'SERVER':<20} {'PID':>7} {'CPU%':>6} {'AVG%':>6} {'MAX%':>6} {'RSS MiB':>8} {'MAX MiB':>8}"
+              f" {'THREADS':>7} {'FILES':>6}")
+        for name, summary in sorted(sampler.summary().items()):
+            current = summary["current"]
+            print(f"{name:<20} {current['pid']:>7} {(current['cpu_ratio'] or 0.0) * 100:>6.1f}"
+                  f" {summary['cpu_ratio_avg'] * 100:>6.1f} {summary['cpu_ratio_max'] * 100:>6.1f}"
+                  f" {current['rss_bytes'] / 2**20:>8.0f} {summary['rss_bytes_max'] / 2**20:>8.0f}"
+                  f" {current['threads']:>7} {current['open_files']:>6}")
+
+    def logs_func(self, args):
+        stream = LogStream(lambda: self.mcst.log_sources(args.server),
+                           self.mcst.catalog.state_dir / "log-cursors.json", args.resume, self.mcst.encoding)
+
+        def emit(record):
+            if args.json:
+                print(json.dumps(record), flush=True)
+            else:
+                print(f"{record['source']}: {record['line']}", flush=True)
+
+        try:
+            stream.run(make_filter(args.server, args.level, args.grep), emit, args.follow, args.lines)
+        except KeyboardInterrupt:
+            pass
+
+    def watch_func(self, args):
+        watcher = Watcher(self.mcst.servers_dir, use_inotify=not args.poll)
+
+        stop = threading.Event()
+
+        def emit(events):
+            try:
+                for event in events:
+                    print(json.dumps(event))
+                sys.stdout.flush()
+            except BrokenPipeError:
+                # Nothing reads the events anymore, the flush at exit must not fail again
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                stop.set()
+
+        def wait_for_reader_gone():
+            # A closed read end shows as an error on stdout right away, not only at the next event written
+            poller = select.poll()
+            poller.register(sys.stdout.fileno(), 0)
+            poller.poll()
+            stop.set()
+
+        # Killing the docker exec client on the host leaves this process running unless it notices itself
+        signal.signal(signal.SIGHUP, lambda signum, frame: stop.set())
+        threading.Thread(target=wait_for_reader_gone, daemon=True).start()
+        try:
+            watcher.run(emit, stop)
+        except KeyboardInterrupt:
+            pass
+
+    def batch_func(self, args):
+        # Server output would corrupt the result stream
+        self.mcst.server_output = sys.stderr
+        operations = OperationsHandler(self.mcst)
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"ok": False, "error": type(e).__name__, "message": str(e)}
+            else:
+                response = operations.execute(request)
+            print(json.dumps(response), flush=True)
+
+    def serve_func(self, args):
+        server = daemon.McstDaemon(args.socket, OperationsHandler(self.mcst))
+        self.mcst.log(f"Serving on {args.socket}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    # noinspection PyMethodMayBeStatic
+    def connect_func(self, args):
+        daemon.relay(args.socket)
 
 
 def main(args):
-    logging.basicConfig(level=logging.DEBUG, filename="mcst.log")
-    ArgumentsHandler(Mcst()).handle(args)
+    logging.basicConfig(level=logging.DEBUG, filename=LOG_FILENAME)
+    mcst = Mcst(os.environ.get("MCST_SERVERS_DIR", "/servers"), os.environ.get("MCST_JARS_DIR", "/jars"),
+                os.environ.get("MCST_JAVA", "/usr/bin/java"))
+    ArgumentsHandler(mcst).handle(args)
 
 
 if __name__ == "__main__":
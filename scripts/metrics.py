@@ -0,0 +1,132 @@
+import collections
+import http.server
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, Optional
+
+from procinfo import find_server_processes
+
+
+HISTORY_SIZE = 120
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+METRICS = [
+    ("mcst_server_cpu_seconds_total", "counter", "CPU time used by the server JVM", "cpu_seconds"),
+    ("mcst_server_cpu_ratio", "gauge", "CPU cores used by the server JVM since the previous sample", "cpu_ratio"),
+    ("mcst_server_resident_memory_bytes", "gauge", "Resident memory of the server JVM", "rss_bytes"),
+    ("mcst_server_threads", "gauge", "Threads of the server JVM", "threads"),
+    ("mcst_server_open_files", "gauge", "Open file descriptors of the server JVM", "open_files"),
+]
+
+
+def read_process(pid: int) -> Optional[dict]:
+    try:
+        stat = pathlib.Path(f"/proc/{pid}/stat").read_text()
+        open_files = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses, the numeric fields follow the last ")"
+    fields = stat[stat.rindex(")") + 2:].split()
+    return {
+        "pid": pid,
+        "timestamp": time.time(),
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "threads": int(fields[17]),
+        "rss_bytes": int(fields[21]) * PAGE_SIZE,
+        "open_files": open_files,
+    }
+
+
+class MetricsSampler:
+    def __init__(self, servers_dir: pathlib.Path, history_size: int = HISTORY_SIZE):
+        self.servers_dir = servers_dir
+        self.history_size = history_size
+        self.history = {}
+        self.lock = threading.Lock()
+
+    def sample(self):
+        processes = find_server_processes(self.servers_dir)
+        with self.lock:
+            for name in set(self.history) - set(processes):
+                del self.history[name]
+            for name, pid in processes.items():
+                sample = read_process(pid)
+                if sample is None:
+                    continue
+                history = self.history.setdefault(name, collections.deque(maxlen=self.history_size))
+                previous = history[-1] if history else None
+                if previous is not None and previous["pid"] == pid and sample["timestamp"] > previous["timestamp"]:
+                    sample["cpu_ratio"] = ((sample["cpu_seconds"] - previous["cpu_seconds"])
+                                           / (sample["timestamp"] - previous["timestamp"]))
+                else:
+                    sample["cpu_ratio"] = None
+                history.append(sample)
+
+    def current(self) -> Dict[str, dict]:
+        with self.lock:
+            return {name: history[-1] for name, history in self.history.items() if history}
+
+    def summary(self) -> Dict[str, dict]:
+        with self.lock:
+            summary = {}
+            for name, history in self.history.items():
+                if not history:
+                    continue
+                # The first sample of a process has nothing to compute a CPU ratio against
+                ratios = [sample["cpu_ratio"] for sample in history if sample["cpu_ratio"] is not None] or [0.0]
+                summary[name] = {
+                    "current": history[-1],
+                    "samples": len(history),
+                    "cpu_ratio_avg": sum(ratios) / len(ratios),
+                    "cpu_ratio_max": max(ratios),
+                    "rss_bytes_max": max(sample["rss_bytes"] for sample in history),
+                }
+            return summary
+
+    def prometheus(self) -> str:
+        current = self.current()
+        lines = []
+        for metric, metric_type, description, field in METRICS:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for name in sorted(current):
+                value = current[name][field]
+                lines.append(f'{metric}{{server="{name}"}} {"NaN" if value is None else value}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: pathlib.Path):
+        temporary = path.with_name(f".{path.name}.tmp")
+        temporary.write_text(self.prometheus())
+        os.replace(temporary, path)
+
+    def run(self, interval: float, stop: threading.Event, prometheus_file: pathlib.Path = None):
+        while not stop.is_set():
+            self.sample()
+            if prometheus_file is not None:
+                self.write_prometheus(prometheus_file)
+            stop.wait(interval)
+
+    def serve(self, port: int) -> http.server.ThreadingHTTPServer:
+        sampler = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sampler.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,119 @@
+import struct
+from typing import Set
+
+
+TAG_END = 0
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+SCALARS = {1: struct.Struct(">b"), 2: struct.Struct(">h"), 3: struct.Struct(">i"),
+           4: struct.Struct(">q"), 5: struct.Struct(">f"), 6: struct.Struct(">d")}
+ARRAY_ITEMS = {TAG_BYTE_ARRAY: "b", TAG_INT_ARRAY: "i", TAG_LONG_ARRAY: "q"}
+UNSIGNED_SHORT = struct.Struct(">H")
+INT = struct.Struct(">i")
+
+
+class NbtReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def read_struct(self, layout: struct.Struct):
+        value = layout.unpack_from(self.data, self.offset)[0]
+        self.offset += layout.size
+        return value
+
+    def read_tag_type(self) -> int:
+        tag = self.data[self.offset]
+        self.offset += 1
+        return tag
+
+    def read_string(self) -> str:
+        length = self.read_struct(UNSIGNED_SHORT)
+        value = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return bytes(value).decode("utf-8", errors="replace")
+
+    def read_root(self) -> dict:
+        if self.read_tag_type() != TAG_COMPOUND:
+            raise ValueError("NBT data does not start with a compound")
+        self.read_string()
+        return self.read_payload(TAG_COMPOUND)
+
+    def read_payload(self, tag: int):
+        if tag in SCALARS:
+            return self.read_struct(SCALARS[tag])
+        if tag == TAG_STRING:
+            return self.read_string()
+        if tag in ARRAY_ITEMS:
+            layout = struct.Struct(f">{self.read_struct(INT)}{ARRAY_ITEMS[tag]}")
+            values = list(layout.unpack_from(self.data, self.offset))
+            self.offset += layout.size
+            return values
+        if tag == TAG_LIST:
+            item_tag = self.read_tag_type()
+            return [self.read_payload(item_tag) for _ in range(self.read_struct(INT))]
+        if tag == TAG_COMPOUND:
+            values = {}
+            while True:
+                item_tag = self.read_tag_type()
+                if item_tag == TAG_END:
+                    return values
+                name = self.read_string()
+                values[name] = self.read_payload(item_tag)
+        raise ValueError(f"Unknown NBT tag {tag}")
+
+    def skip_payload(self, tag: int):
+        if tag in SCALARS:
+            self.offset += SCALARS[tag].size
+        elif tag == TAG_STRING:
+            length = self.read_struct(UNSIGNED_SHORT)
+            self.offset += length
+        elif tag in ARRAY_ITEMS:
+            length = self.read_struct(INT)
+            self.offset += length * struct.calcsize(ARRAY_ITEMS[tag])
+        elif tag == TAG_LIST:
+            item_tag = self.read_tag_type()
+            length = self.read_struct(INT)
+            if item_tag in SCALARS:
+                self.offset += length * SCALARS[item_tag].size
+            else:
+                for _ in range(length):
+                    self.skip_payload(item_tag)
+        elif tag == TAG_COMPOUND:
+            while True:
+                item_tag = self.read_tag_type()
+                if item_tag == TAG_END:
+                    return
+                self.skip_payload(TAG_STRING)
+                self.skip_payload(item_tag)
+        elif tag != TAG_END:
+            raise ValueError(f"Unknown NBT tag {tag}")
+
+    def find(self, wanted: Set[str], descend: Set[str] = frozenset()) -> dict:
+        # Reads only the wanted values, everything else is skipped without being decoded
+        if self.read_tag_type() != TAG_COMPOUND:
+            raise ValueError("NBT data does not start with a compound")
+        self.read_string()
+        found = {}
+        self.find_in_compound(wanted, descend, found)
+        return found
+
+    def find_in_compound(self, wanted: Set[str], descend: Set[str], found: dict) -> bool:
+        while True:
+            tag = self.read_tag_type()
+            if tag == TAG_END:
+                return False
+            name = self.read_string()
+            if tag == TAG_COMPOUND and name in descend:
+                if self.find_in_compound(wanted, descend, found):
+                    return True
+            elif name in wanted and (tag in SCALARS or tag == TAG_STRING):
+                found[name] = self.read_payload(tag)
+                if len(found) == len(wanted):
+                    return True
+            else:
+                self.skip_payload(tag)
@@ -0,0 +1,21 @@
+import os
+import pathlib
+from typing import Dict
+
+
+def find_server_processes(servers_dir: pathlib.Path) -> Dict[str, int]:
+    servers = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            cmdline = pathlib.Path(f"/proc/{pid}/cmdline").read_bytes().split(b"\0")
+            cwd = pathlib.Path(os.readlink(f"/proc/{pid}/cwd"))
+        except OSError:
+            # Gone already, or owned by somebody else
+            continue
+        if not cmdline or os.path.basename(cmdline[0]) != b"java" or b"-jar" not in cmdline:
+            continue
+        if cwd.parent == servers_dir:
+            servers.setdefault(cwd.name, int(pid))
+    return servers
@@ -0,0 +1,133 @@
+import pathlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from storage import write_text_atomic
+
+
+ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "f": "\f"}
+
+
+def unescape(text: str) -> str:
+    result = []
+    index = 0
+    while index < len(text):
+        char = text[index]
+        index += 1
+        if char != "\\" or index == len(text):
+            result.append(char)
+            continue
+        char = text[index]
+        index += 1
+        if char == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[index:index + 4]):
+            result.append(chr(int(text[index:index + 4], 16)))
+            index += 4
+        else:
+            result.append(ESCAPES.get(char, char))
+    return "".join(result)
+
+
+def escape(text: str, is_key: bool = False) -> str:
+    result = []
+    for index, char in enumerate(text):
+        if char == "\\":
+            result.append("\\\\")
+        elif char in "\t\n\r\f":
+            result.append("\\" + {value: key for key, value in ESCAPES.items()}[char])
+        elif char in "=:#!" or (char == " " and (is_key or index == 0)):
+            result.append("\\" + char)
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def split_key_value(logical: str) -> Tuple[str, str]:
+    index = 0
+    while index < len(logical) and logical[index] not in "=: \t\f":
+        index += 2 if logical[index] == "\\" else 1
+    key = logical[:index]
+    rest = logical[index:].lstrip(" \t\f")
+    if rest[:1] in ("=", ":"):
+        rest = rest[1:].lstrip(" \t\f")
+    return key, rest
+
+
+class PropertyLine:
+    def __init__(self, text: str, key: Optional[str] = None, value: Optional[str] = None):
+        self.text = text
+        self.key = key
+        self.value = value
+
+
+class ServerProperties:
+    def __init__(self, lines: List[PropertyLine]):
+        self.lines = lines
+
+    @staticmethod
+    def parse(content: str) -> "ServerProperties":
+        lines = []
+        physical = content.splitlines()
+        index = 0
+        while index < len(physical):
+            text = physical[index]
+            logical = text.lstrip()
+            # A line ending in an odd number of backslashes continues on the next one
+            while (len(logical) - len(logical.rstrip("\\"))) % 2 == 1 and index + 1 < len(physical):
+                index += 1
+                text += "\n" + physical[index]
+                logical = logical[:-1] + physical[index].lstrip()
+            index += 1
+            if not logical or logical[0] in "#!":
+                lines.append(PropertyLine(text))
+                continue
+            key, value = split_key_value(logical)
+            lines.append(PropertyLine(text, unescape(key), unescape(value)))
+        return ServerProperties(lines)
+
+    @staticmethod
+    def load(path: pathlib.Path, encoding: str = "utf-8") -> "ServerProperties":
+        return ServerProperties.parse(path.read_text(encoding=encoding))
+
+    def dump(self) -> str:
+        return "".join(line.text + "\n" for line in self.lines)
+
+    def save(self, path: pathlib.Path, encoding: str = "utf-8"):
+        write_text_atomic(path, self.dump(), encoding)
+
+    def find(self, key: str) -> Optional[PropertyLine]:
+        for line in self.lines:
+            if line.key == key:
+                return line
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        line = self.find(key)
+        return None if line is None else line.value
+
+    def items(self) -> Dict[str, str]:
+        return {line.key: line.value for line in self.lines if line.key is not None}
+
+    def set(self, key: str, value: str) -> bool:
+        line = self.find(key)
+        if line is not None and line.value == value:
+            return False
+        text = f"{escape(key, is_key=True)}={escape(value)}"
+        if line is None:
+            self.lines.append(PropertyLine(text, key, value))
+        else:
+            line.text, line.value = text, value
+        return True
+
+    def remove(self, key: str) -> bool:
+        line = self.find(key)
+        if line is None:
+            return False
+        self.lines.remove(line)
+        return True
+
+    def patch(self, changes: Dict[str, Optional[str]]) -> List[str]:
+        changed = []
+        for key, value in changes.items():
+            if (self.remove(key) if value is None else self.set(key, f"{value}")):
+                changed.append(key)
+        return changed
@@ -0,0 +1,178 @@
+import itertools
+import secrets
+import socket
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+RESPONSE_VALUE = 0
+EXEC_COMMAND = 2
+AUTH_RESPONSE = 2
+AUTH = 3
+AUTH_FAILED = -1
+LENGTH = struct.Struct("<i")
+HEADER = struct.Struct("<ii")
+MAX_PACKET_SIZE = 1024 * 1024
+# The server splits longer responses into several packets of this size
+RESPONSE_CHUNK = 4096
+RCON_PORT_RANGE = range(25600, 25700)
+DEFAULT_TIMEOUT = 5.0
+READ_SIZE = 65536
+
+
+def new_password() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def encode_packet(request_id: int, packet_type: int, body: str) -> bytes:
+    data = HEADER.pack(request_id, packet_type) + body.encode("utf-8") + b"\0\0"
+    return LENGTH.pack(len(data)) + data
+
+
+class RconClient:
+    def __init__(self, host: str, port: int, password: str, timeout: float = DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.connection = None
+        self.buffer = bytearray()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.nothing_answered = True
+
+    def connect(self):
+        self.connection = socket.create_connection((self.host, self.port), self.timeout)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer.clear()
+        request_id = next(self.ids)
+        self.connection.sendall(encode_packet(request_id, AUTH, self.password))
+        while True:
+            # Some servers send an empty response value before the result of the authentication
+            response_id, packet_type, _ = self.read_packet()
+            if packet_type == AUTH_RESPONSE:
+                break
+        if response_id == AUTH_FAILED:
+            self.close()
+            raise PermissionError(f"RCON password rejected by {self.host}:{self.port}")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def read_packet(self) -> Tuple[int, int, str]:
+        while True:
+            if len(self.buffer) >= LENGTH.size:
+                (length,) = LENGTH.unpack_from(self.buffer, 0)
+                if length < HEADER.size + 2 or length > MAX_PACKET_SIZE:
+                    raise ConnectionError(f"Invalid RCON packet length {length}")
+                if len(self.buffer) >= LENGTH.size + length:
+                    packet = bytes(self.buffer[LENGTH.size:LENGTH.size + length])
+                    del self.buffer[:LENGTH.size + length]
+                    request_id, packet_type = HEADER.unpack_from(packet, 0)
+                    return request_id, packet_type, packet[HEADER.size:-2].decode("utf-8", errors="replace")
+            data = self.connection.recv(READ_SIZE)
+            if not data:
+                raise ConnectionResetError(f"RCON connection to {self.host}:{self.port} closed")
+            self.buffer += data
+
+    def execute(self, commands: List[str], pipeline: bool = False) -> List[str]:
+        with self.lock:
+            reused = self.connection is not None
+            if not reused:
+                self.connect()
+            try:
+                return self.send_commands(commands, pipeline)
+            except ConnectionError:
+                self.close()
+                # A pooled connection may have died with a restart of the server, nothing was run on it then
+                if not reused or not self.nothing_answered:
+                    raise
+                self.connect()
+                return self.send_commands(commands, pipeline)
+            except OSError:
+                self.close()
+                raise
+
+    def send_commands(self, commands: List[str], pipeline: bool) -> List[str]:
+        self.nothing_answered = True
+        if pipeline:
+            # All commands go in one write, the marker request is answered after the last of them
+            ids = [next(self.ids) for _ in commands]
+            marker = next(self.ids)
+            self.connection.sendall(b"".join(encode_packet(request_id, EXEC_COMMAND, command)
+                                             for request_id, command in zip(ids, commands))
+                                    + encode_packet(marker, RESPONSE_VALUE, ""))
+            return self.read_responses(ids, marker)
+        responses = []
+        for command in commands:
+            request_id = next(self.ids)
+            self.connection.sendall(encode_packet(request_id, EXEC_COMMAND, command))
+            responses.append(self.read_response(request_id))
+        return responses
+
+    def read_responses(self, ids: List[int], marker: int) -> List[str]:
+        parts = {request_id: [] for request_id in ids}
+        while True:
+            response_id, _, body = self.read_packet()
+            self.nothing_answered = False
+            if response_id == marker:
+                return ["".join(parts[request_id]) for request_id in ids]
+            if response_id == AUTH_FAILED:
+                raise PermissionError(f"RCON session to {self.host}:{self.port} is not authenticated")
+            if response_id in parts:
+                parts[response_id].append(body)
+
+    def read_response(self, request_id: int) -> str:
+        response_id, _, body = self.read_packet()
+        self.nothing_answered = False
+        if response_id == AUTH_FAILED:
+            raise PermissionError(f"RCON session to {self.host}:{self.port} is not authenticated")
+        if len(body.encode("utf-8")) < RESPONSE_CHUNK:
+            return body
+        # A full chunk may have more following, the server has read the command by now,
+        # so the marker request arrives on its own and is answered after the rest
+        marker = next(self.ids)
+        self.connection.sendall(encode_packet(marker, RESPONSE_VALUE, ""))
+        return body + self.read_responses([request_id], marker)[0]
+
+
+class RconPool:
+    def __init__(self, host: str = "127.0.0.1", timeout: float = DEFAULT_TIMEOUT):
+        self.host = host
+        self.timeout = timeout
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def client(self, name: str, port: int, password: str) -> RconClient:
+        with self.lock:
+            client = self.clients.get(name)
+            # A changed port or password needs a new session
+            if client is None or (client.port, client.password) != (port, password):
+                if client is not None:
+                    client.close()
+                client = RconClient(self.host, port, password, self.timeout)
+                self.clients[name] = client
+            return client
+
+    def execute(self, name: str, port: int, password: str, commands: List[str], pipeline: bool = False) -> List[str]:
+        return self.client(name, port, password).execute(commands, pipeline)
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+
+
+def choose_port(used: Dict[str, Optional[int]], name: str, current: Optional[int]) -> int:
+    taken = {port for other, port in used.items() if other != name and port is not None}
+    # The default 25575 is kept out, game ports of supervised servers go up to there
+    if current in RCON_PORT_RANGE and current not in taken:
+        return current
+    for port in RCON_PORT_RANGE:
+        if port not in taken:
+            return port
+    raise RuntimeError(f"No free RCON port left in {RCON_PORT_RANGE.start}-{RCON_PORT_RANGE.stop - 1}")
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import struct
+import time
+from typing import Tuple
+
+
+STATUS = 1
+LOGIN = 2
+HANDSHAKE_PACKET = 0x00
+STATUS_REQUEST_PACKET = 0x00
+STATUS_RESPONSE_PACKET = 0x00
+LOGIN_DISCONNECT_PACKET = 0x00
+PING_PACKET = 0x01
+MAX_PACKET_SIZE = 2 * 1024 * 1024
+UNSIGNED_SHORT = struct.Struct(">H")
+LONG = struct.Struct(">q")
+
+
+def encode_varint(value: int) -> bytes:
+    # VarInts are 32 bit two's complement, seven bits per byte with the high bit as continuation
+    value &= 0xFFFFFFFF
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def decode_varint(data: bytes, offset: int = 0) -> Tuple[int, int]:
+    value = 0
+    for shift in range(0, 35, 7):
+        if offset >= len(data):
+            raise ValueError("Truncated VarInt")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return (value - (1 << 32) if value & 0x80000000 else value), offset
+    raise ValueError("VarInt is too long")
+
+
+async def read_varint(reader: asyncio.StreamReader) -> int:
+    data = b""
+    while len(data) < 5:
+        data += await reader.readexactly(1)
+        if not data[-1] & 0x80:
+            return decode_varint(data)[0]
+    raise ValueError("VarInt is too long")
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return encode_varint(len(data)) + data
+
+
+def decode_string(data: bytes, offset: int = 0) -> Tuple[str, int]:
+    length, offset = decode_varint(data, offset)
+    if length < 0 or offset + length > len(data):
+        raise ValueError("Truncated string")
+    return data[offset:offset + length].decode("utf-8", errors="replace"), offset + length
+
+
+def encode_packet(packet_id: int, payload: bytes = b"") -> bytes:
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    length = await read_varint(reader)
+    if length <= 0 or length > MAX_PACKET_SIZE:
+        raise ValueError(f"Invalid packet length {length}")
+    body = await reader.readexactly(length)
+    packet_id, offset = decode_varint(body)
+    return packet_id, body[offset:]
+
+
+class Handshake:
+    def __init__(self, protocol: int, address: str, port: int, next_state: int):
+        self.protocol = protocol
+        self.address = address
+        self.port = port
+        self.next_state = next_state
+
+    @classmethod
+    def decode(cls, payload: bytes) -> "Handshake":
+        protocol, offset = decode_varint(payload)
+        address, offset = decode_string(payload, offset)
+        (port,) = UNSIGNED_SHORT.unpack_from(payload, offset)
+        next_state, _ = decode_varint(payload, offset + UNSIGNED_SHORT.size)
+        return cls(protocol, address, port, next_state)
+
+    def encode(self) -> bytes:
+        return encode_packet(HANDSHAKE_PACKET, encode_varint(self.protocol) + encode_string(self.address)
+                             + UNSIGNED_SHORT.pack(self.port) + encode_varint(self.next_state))
+
+
+def status_response(motd: str, version: str, protocol: int, online: int = 0, maximum: int = 0,
+                    extra: dict = None) -> bytes:
+    status = {
+        "version": {"name": version, "protocol": protocol},
+        "players": {"max": maximum, "online": online, "sample": []},
+        "description": {"text": motd},
+    }
+    # Clients ignore fields they do not know
+    status.update(extra or {})
+    return encode_packet(STATUS_RESPONSE_PACKET, encode_string(json.dumps(status)))
+
+
+def description_text(description) -> str:
+    # The MOTD is a plain string on old servers, a chat component with nested extra parts on new ones
+    if isinstance(description, str):
+        return description
+    if not isinstance(description, dict):
+        return ""
+    return description.get("text", "") + "".join(description_text(part) for part in description.get("extra", []))
+
+
+def login_disconnect(message: str) -> bytes:
+    return encode_packet(LOGIN_DISCONNECT_PACKET, encode_string(json.dumps({"text": message})))
+
+
+async def query_status(host: str, port: int, timeout: float, protocol: int = -1) -> dict:
+    # Protocol -1 asks for the status without claiming a client version
+    started = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        async def exchange() -> dict:
+            writer.write(Handshake(protocol, host, port, STATUS).encode() + encode_packet(STATUS_REQUEST_PACKET))
+            await writer.drain()
+            packet_id, payload = await read_packet(reader)
+            if packet_id != STATUS_RESPONSE_PACKET:
+                raise ValueError(f"Unexpected packet {packet_id} instead of the status")
+            status = json.loads(decode_string(payload)[0])
+            sent = time.perf_counter()
+            writer.write(encode_packet(PING_PACKET, LONG.pack(int(sent * 1000))))
+            await writer.drain()
+            packet_id, _ = await read_packet(reader)
+            if packet_id != PING_PACKET:
+                raise ValueError(f"Unexpected packet {packet_id} instead of the pong")
+            status["latency_ms"] = (time.perf_counter() - sent) * 1000
+            return status
+
+        return await asyncio.wait_for(exchange(), max(0.0, timeout - (time.perf_counter() - started)))
+    finally:
+        writer.close()
@@ -0,0 +1,55 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+
+
+def read_json(path: pathlib.Path, default=None, encoding: str = "utf-8"):
+    try:
+        return json.loads(path.read_text(encoding=encoding))
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def write_text_atomic(path: pathlib.Path, text: str, encoding: str = "utf-8"):
+    temporary = path.with_name(f".{path.name}.tmp")
+    with open(temporary, "w", encoding=encoding) as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.chmod(temporary, path.stat().st_mode & 0o7777)
+    except FileNotFoundError:
+        pass
+    os.replace(temporary, path)
+
+
+def write_json_atomic(path: pathlib.Path, data, encoding: str = "utf-8"):
+    write_text_atomic(path, json.dumps(data, indent=1, sort_keys=True), encoding)
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: pathlib.Path):
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+@contextlib.contextmanager
+def locked_json(path: pathlib.Path, lock_path: pathlib.Path, default, encoding: str = "utf-8"):
+    # The lock lives in its own file, the data file is replaced by every write
+    with file_lock(lock_path):
+        data = read_json(path, default, encoding)
+        yield data
+        write_json_atomic(path, data, encoding)
+
+
+def hash_file(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
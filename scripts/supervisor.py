@@ -0,0 +1,132 @@
+import asyncio
+import signal
+import socket
+from typing import List, Optional
+
+
+PORT_RANGE = range(25565, 25576)
+INITIAL_BACKOFF = 5.0
+MAX_BACKOFF = 300.0
+STABLE_RUNTIME = 600.0
+STOP_TIMEOUT = 60.0
+
+
+def is_port_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            probe.bind(("0.0.0.0", port))
+        except OSError:
+            return False
+    return True
+
+
+class ManagedServer:
+    def __init__(self, name: str, port: int, version: Optional[str]):
+        self.name = name
+        self.port = port
+        self.version = version
+        self.process = None
+        self.backoff = INITIAL_BACKOFF
+        self.restarts = 0
+
+
+class Supervisor:
+    def __init__(self, mcst, ports: range = PORT_RANGE):
+        self.mcst = mcst
+        self.ports = ports
+        self.servers = {}
+        self.stopping = None
+
+    def allocate_port(self, preferred: Optional[int]) -> int:
+        used = {server.port for server in self.servers.values()}
+        candidates = ([preferred] if preferred in self.ports else []) + list(self.ports)
+        for port in candidates:
+            if port not in used and is_port_free(port):
+                return port
+        raise RuntimeError(f"No free port left in {self.ports.start}-{self.ports.stop - 1}")
+
+    def add(self, name: str, version: str = None) -> ManagedServer:
+        info = self.mcst.info(name)
+        server = ManagedServer(name, self.allocate_port(info.get("port")),
+                               version or info.get("last_server_version") or None)
+        self.servers[name] = server
+        return server
+
+    def run(self, names: List[str]):
+        asyncio.run(self.run_async(names))
+
+    async def run_async(self, names: List[str]):
+        self.stopping = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stopping.set)
+        for name in names:
+            # One unknown server or a full port range leaves the others supervised
+            try:
+                self.add(name)
+            except FileNotFoundError:
+                self.mcst.log(f"Unknown server {name}, not supervising it")
+            except RuntimeError as e:
+                self.mcst.log(f"Cannot supervise {name}: {e}")
+        tasks = [asyncio.ensure_future(self.supervise(server)) for server in self.servers.values()]
+        finished = asyncio.ensure_future(asyncio.gather(*tasks))
+        await asyncio.wait([finished, asyncio.ensure_future(self.stopping.wait())],
+                           return_when=asyncio.FIRST_COMPLETED)
+        self.stopping.set()
+        await asyncio.gather(*(self.stop(server) for server in self.servers.values()))
+        await finished
+
+    async def supervise(self, server: ManagedServer):
+        loop = asyncio.get_event_loop()
+        while not self.stopping.is_set():
+            try:
+                launch = self.mcst.prepare_start(server.name, port=server.port, version=server.version,
+                                                 planned=list(self.servers))
+            except (OSError, ValueError) as e:
+                self.mcst.log(f"Cannot start {server.name}: {e!r}")
+                break
+            started = loop.time()
+            server.process = await asyncio.create_subprocess_exec(
+                *launch.command, cwd=launch.directory,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            self.mcst.log(f"Supervisor started {server.name} on port {server.port}, pid {server.process.pid}")
+            if self.stopping.is_set():
+                await self.stop(server)
+            returncode = await server.process.wait()
+            await loop.run_in_executor(None, self.mcst.finish_start, launch)
+            if self.stopping.is_set():
+                break
+            if returncode == 0:
+                self.mcst.log(f"{server.name} stopped by itself, not restarting it")
+                break
+            if loop.time() - started > STABLE_RUNTIME:
+                server.backoff = INITIAL_BACKOFF
+            self.mcst.log(f"{server.name} exited with {returncode}, restarting in {server.backoff:.0f}s")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), server.backoff)
+            except asyncio.TimeoutError:
+                pass
+            server.backoff = min(server.backoff * 2, MAX_BACKOFF)
+            server.restarts += 1
+
+    async def stop(self, server: ManagedServer):
+        process = server.process
+        if process is None or process.returncode is not None:
+            return
+        self.mcst.log(f"Stopping {server.name}")
+        try:
+            # Lets the server save the world, unlike a signal
+            process.stdin.write(b"stop\n")
+            await process.stdin.drain()
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
@@ -0,0 +1,117 @@
+import os
+import pathlib
+import time
+from typing import Dict, List, Optional
+
+from storage import locked_json, read_json, write_json_atomic
+
+
+USAGE_FILENAME = "usage.json"
+QUOTAS_FILENAME = "quotas.json"
+UNITS = ["B", "KiB", "MiB", "GiB", "TiB"]
+
+
+def parse_size(size: str) -> Optional[int]:
+    if size.lower() in ("none", "0", ""):
+        return None
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    unit = size[-1].upper()
+    try:
+        if unit in units:
+            return int(float(size[:-1]) * units[unit])
+        return int(size)
+    except ValueError:
+        raise ValueError(f"Invalid size: {size}")
+
+
+def format_size(size: Optional[int]) -> str:
+    if size is None:
+        return "-"
+    value = float(size)
+    for unit in UNITS:
+        if value < 1024 or unit == UNITS[-1]:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+class UsageTracker:
+    def __init__(self, servers_dir: pathlib.Path, state_dir: pathlib.Path, encoding: str = "utf-8"):
+        self.servers_dir = servers_dir
+        self.state_dir = state_dir
+        self.usage_file = state_dir / USAGE_FILENAME
+        self.quotas_file = state_dir / QUOTAS_FILENAME
+        self.encoding = encoding
+
+    def transaction(self):
+        return locked_json(self.usage_file, self.state_dir / "usage.lock", {"servers": {}}, self.encoding)
+
+    def mark_dirty(self, name: str):
+        with self.transaction() as data:
+            if name in data["servers"]:
+                data["servers"][name]["dirty"] = True
+
+    def refresh(self, names: List[str] = None, busy: List[str] = (), full: bool = False) -> Dict[str, int]:
+        with self.transaction() as data:
+            servers = data["servers"]
+            with os.scandir(self.servers_dir) as entries:
+                present = {entry.name for entry in entries
+                           if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)}
+            for name in set(servers) - present:
+                del servers[name]
+            sizes = {}
+            for name in sorted(present):
+                if names and name not in names:
+                    continue
+                known = servers.get(name, {})
+                # Files are rewritten in place only while a server runs, which leaves the directory mtimes alone
+                restat = full or known.get("dirty", True) or name in busy
+                dirs = {}
+                size = self.scan_dir(self.servers_dir / name, "", known.get("dirs", {}), dirs, restat)
+                servers[name] = {"size": size, "dirs": dirs, "dirty": name in busy, "scanned": time.time()}
+                sizes[name] = size
+            return sizes
+
+    def scan_dir(self, path: pathlib.Path, relative: str, known: dict, dirs: dict, restat: bool) -> int:
+        try:
+            mtime_ns = os.lstat(path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        entry = known.get(relative)
+        if entry is None or entry["mtime_ns"] != mtime_ns or restat:
+            # Only a directory with added, removed or renamed entries needs listing again
+            entry = {"mtime_ns": mtime_ns, "files": 0, "subdirs": []}
+            with os.scandir(path) as children:
+                for child in children:
+                    try:
+                        if child.is_dir(follow_symlinks=False):
+                            entry["subdirs"].append(child.name)
+                        else:
+                            entry["files"] += child.stat(follow_symlinks=False).st_blocks * 512
+                    except FileNotFoundError:
+                        pass
+        dirs[relative] = entry
+        size = entry["files"]
+        for subdir in entry["subdirs"]:
+            size += self.scan_dir(path / subdir, f"{relative}/{subdir}", known, dirs, restat)
+        return size
+
+    def quotas(self) -> dict:
+        return read_json(self.quotas_file, {"default": {}, "servers": {}}, self.encoding)
+
+    def quota_of(self, name: str, quotas: dict = None) -> dict:
+        quotas = quotas or self.quotas()
+        # A null limit of a server lifts the default one
+        return dict(quotas["default"], **quotas["servers"].get(name, {}))
+
+    def set_quota(self, name: Optional[str], quota: Dict[str, Optional[int]]):
+        if quota.get("soft") is not None and quota.get("hard") is not None and quota["soft"] > quota["hard"]:
+            raise ValueError("The soft quota must not be above the hard quota")
+        self.state_dir.mkdir(exist_ok=True)
+        quotas = self.quotas()
+        if name is None:
+            quotas["default"] = {key: value for key, value in quota.items() if value is not None}
+        elif quota:
+            quotas["servers"][name] = quota
+        else:
+            quotas["servers"].pop(name, None)
+        write_json_atomic(self.quotas_file, quotas, self.encoding)
@@ -0,0 +1,182 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+POLL_INTERVAL = 2.0
+COALESCE_SECONDS = 0.25
+SETTINGS_FILENAME = "server.properties"
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+SERVERS_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+SERVER_MASK = IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_TO | IN_ONLYDIR
+
+
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: pathlib.Path, mask: int) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(f"{path}"), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), f"{path}")
+        return wd
+
+    def read(self) -> List[tuple]:
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    def __init__(self, servers_dir: pathlib.Path, use_inotify: bool = True,
+                 poll_interval: float = POLL_INTERVAL, coalesce_seconds: float = COALESCE_SECONDS):
+        self.servers_dir = servers_dir
+        self.use_inotify = use_inotify
+        self.poll_interval = poll_interval
+        self.coalesce_seconds = coalesce_seconds
+        self.inotify = None
+        self.watches = {}
+        self.known = {}
+        self.pending = {}
+
+    def scan(self) -> Dict[str, Optional[int]]:
+        servers = {}
+        with os.scandir(self.servers_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                try:
+                    servers[entry.name] = os.stat(os.path.join(entry.path, SETTINGS_FILENAME)).st_mtime_ns
+                except FileNotFoundError:
+                    servers[entry.name] = None
+        return servers
+
+    def rescan(self):
+        current = self.scan()
+        for name in self.known.keys() - current.keys():
+            self.add_event("removed", name)
+        for name, mtime_ns in current.items():
+            if name not in self.known:
+                self.add_event("added", name)
+                self.watch_server(name)
+            elif mtime_ns != self.known[name]:
+                self.add_event("settings", name)
+        self.known = current
+
+    def add_event(self, event: str, name: str):
+        # Only the newest of added and removed matters, a settings change is implied by either
+        if event == "settings" and self.pending.get(name) in ("added", "removed"):
+            return
+        self.pending[name] = event
+
+    def start_inotify(self):
+        try:
+            self.inotify = Inotify()
+            self.inotify.add_watch(self.servers_dir, SERVERS_MASK)
+        except (OSError, AttributeError) as e:
+            logging.info(f"Watching {self.servers_dir} by polling, inotify is not available: {e}")
+            self.stop_inotify()
+
+    def stop_inotify(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+        self.watches.clear()
+
+    def watch_server(self, name: str):
+        if self.inotify is None:
+            return
+        try:
+            self.watches[self.inotify.add_watch(self.servers_dir / name, SERVER_MASK)] = name
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Typically ENOSPC, max_user_watches is used up
+            logging.info(f"Watching {self.servers_dir} by polling from now on: {e}")
+            self.stop_inotify()
+
+    def read_inotify(self):
+        for wd, mask, name in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, only a full scan can tell what changed
+                self.rescan()
+            elif mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif wd in self.watches:
+                if name == SETTINGS_FILENAME:
+                    self.add_event("settings", self.watches[wd])
+            elif mask & IN_ISDIR and not name.startswith("."):
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_event("added", name)
+                    self.known[name] = None
+                    self.watch_server(name)
+                else:
+                    self.add_event("removed", name)
+                    self.known.pop(name, None)
+            if self.inotify is None:
+                break
+
+    def run(self, emit: Callable[[List[dict]], None], stop: threading.Event):
+        if self.use_inotify:
+            self.start_inotify()
+        self.known = self.scan()
+        for name in self.known:
+            self.watch_server(name)
+        deadline = None
+        try:
+            while not stop.is_set():
+                timeout = self.poll_interval if self.inotify is None else 1.0
+                if deadline is not None:
+                    timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+                if self.inotify is None:
+                    stop.wait(timeout)
+                    self.rescan()
+                elif select.select([self.inotify.fd], [], [], timeout)[0]:
+                    self.read_inotify()
+                if self.pending and deadline is None:
+                    # Hold the first event back a little, bursts like an unzipped world arrive as one batch
+                    deadline = time.monotonic() + self.coalesce_seconds
+                if deadline is not None and time.monotonic() >= deadline:
+                    emit([{"event": event, "name": name} for name, event in sorted(self.pending.items())])
+                    self.pending.clear()
+                    deadline = None
+        finally:
+            self.stop_inotify()
@@ -0,0 +1,124 @@
+import errno
+import fcntl
+import os
+import pathlib
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+FICLONE = 0x40049409
+CHUNK_SIZE = 32 * 1024 * 1024
+PROGRESS_INTERVAL = 1.0
+UNSUPPORTED_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF)
+
+
+class WorldCopier:
+    def __init__(self, workers: int = None, progress: Optional[Callable[[int, int], None]] = None):
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.copied = 0
+        self.total = 0
+        self.last_report = 0.0
+        self.last_reported = None
+        self.reflink_supported = True
+        self.copy_file_range_supported = hasattr(os, "copy_file_range")
+
+    def copy_tree(self, source: pathlib.Path, target: pathlib.Path):
+        files = []
+        for root, dirs, filenames in os.walk(source):
+            relative = pathlib.Path(root).relative_to(source)
+            (target / relative).mkdir(exist_ok=relative != pathlib.Path("."))
+            for filename in filenames:
+                source_file = pathlib.Path(root) / filename
+                target_file = target / relative / filename
+                if source_file.is_symlink():
+                    os.symlink(os.readlink(source_file), target_file)
+                else:
+                    files.append((source_file, target_file, source_file.stat().st_size))
+        self.total = sum(size for _, _, size in files)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            chunks = []
+            for source_file, target_file, size in files:
+                if self.reflink(source_file, target_file):
+                    self.advance(size)
+                    continue
+                os.truncate(target_file, size)
+                chunks.extend(executor.submit(self.copy_range, source_file, target_file, offset,
+                                              min(CHUNK_SIZE, size - offset))
+                              for offset in range(0, size, CHUNK_SIZE))
+            for chunk in chunks:
+                chunk.result()
+        for source_file, target_file, _ in files:
+            shutil.copystat(source_file, target_file)
+        for root, dirs, filenames in os.walk(source):
+            shutil.copystat(root, target / pathlib.Path(root).relative_to(source))
+        self.report(force=True)
+
+    def reflink(self, source_file: pathlib.Path, target_file: pathlib.Path) -> bool:
+        with open(source_file, "rb") as src, open(target_file, "wb") as dst:
+            if not self.reflink_supported:
+                return False
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return True
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRORS:
+                    raise
+                self.reflink_supported = False
+                return False
+
+    def copy_range(self, source_file: pathlib.Path, target_file: pathlib.Path, offset: int, length: int):
+        src = os.open(source_file, os.O_RDONLY)
+        try:
+            dst = os.open(target_file, os.O_WRONLY)
+            try:
+                end = offset + length
+                while offset < end:
+                    copied = self.copy_block(src, dst, offset, end - offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+                    self.advance(copied)
+            finally:
+                os.close(dst)
+        finally:
+            os.close(src)
+
+    def copy_block(self, src: int, dst: int, offset: int, length: int) -> int:
+        if self.copy_file_range_supported:
+            try:
+                # Lets the filesystem share extents or copy server side without passing through userspace
+                return os.copy_file_range(src, dst, length, offset, offset)
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRORS:
+                    raise
+                self.copy_file_range_supported = False
+        data = os.pread(src, min(length, 1024 * 1024), offset)
+        written = 0
+        while written < len(data):
+            written += os.pwrite(dst, data[written:], offset + written)
+        return len(data)
+
+    def advance(self, size: int):
+        with self.lock:
+            self.copied += size
+        self.report()
+
+    def report(self, force: bool = False):
+        if self.progress is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_report < PROGRESS_INTERVAL:
+                return
+            copied, total = self.copied, self.total
+            # The final report repeats the last one when the copy finished right after it
+            if (copied, total) == self.last_reported:
+                return
+            self.last_report = now
+            self.last_reported = copied, total
+        self.progress(copied, total)
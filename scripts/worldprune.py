@@ -0,0 +1,192 @@
+import gzip
+import math
+import mmap
+import os
+import pathlib
+import re
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from nbt import NbtReader
+
+
+SECTOR_SIZE = 4096
+HEADER_SIZE = 2 * SECTOR_SIZE
+CHUNKS_PER_REGION = 1024
+EXTERNAL_FLAG = 128
+REGION_FILENAME = re.compile(r"^r\.(-?\d+)\.(-?\d+)\.mca$")
+COMPANION_DIRS = ["entities", "poi"]
+HEADER_TABLE = struct.Struct(f">{CHUNKS_PER_REGION}I")
+CHUNK_HEADER = struct.Struct(">IB")
+
+
+class PruneRules:
+    def __init__(self, min_inhabited: Optional[int] = None, max_radius: Optional[int] = None,
+                 keep_radius: Optional[int] = None, center: Tuple[int, int] = (0, 0)):
+        self.min_inhabited = min_inhabited
+        self.max_radius = max_radius
+        self.keep_radius = keep_radius
+        self.center = center
+
+    def distance(self, chunk_x: int, chunk_z: int) -> float:
+        # Measured from the middle of the chunk, in blocks
+        return math.hypot(chunk_x * 16 + 8 - self.center[0], chunk_z * 16 + 8 - self.center[1])
+
+
+def decompress_chunk(region: pathlib.Path, data: bytes, chunk_x: int, chunk_z: int) -> Optional[bytes]:
+    length, compression = CHUNK_HEADER.unpack_from(data, 0)
+    payload = data[CHUNK_HEADER.size:4 + length]
+    if compression & EXTERNAL_FLAG:
+        # Oversized chunks live in their own file next to the region
+        payload = (region.parent / f"c.{chunk_x}.{chunk_z}.mcc").read_bytes()
+        compression &= ~EXTERNAL_FLAG
+    if compression == 1:
+        return gzip.decompress(payload)
+    if compression == 2:
+        return zlib.decompress(payload)
+    if compression == 3:
+        return payload
+    # LZ4 or a custom compression, the chunk is kept as it can not be inspected
+    return None
+
+
+def inhabited_time(region: pathlib.Path, data: bytes, chunk_x: int, chunk_z: int) -> Optional[int]:
+    try:
+        nbt = decompress_chunk(region, data, chunk_x, chunk_z)
+        if nbt is None:
+            return None
+        # Before 1.18 the chunk values are nested in a Level compound
+        return NbtReader(nbt).find({"InhabitedTime"}, {"Level"}).get("InhabitedTime")
+    except (OSError, ValueError, IndexError, struct.error, zlib.error, EOFError):
+        return None
+
+
+def read_entries(view) -> List[Tuple[int, int, int, int]]:
+    entries = []
+    locations = HEADER_TABLE.unpack_from(view, 0)
+    timestamps = HEADER_TABLE.unpack_from(view, SECTOR_SIZE)
+    for index, location in enumerate(locations):
+        offset, sectors = location >> 8, location & 0xFF
+        start, end = offset * SECTOR_SIZE, (offset + sectors) * SECTOR_SIZE
+        if location == 0 or start < HEADER_SIZE or end > len(view):
+            continue
+        length = CHUNK_HEADER.unpack_from(view, start)[0]
+        if length == 0 or start + 4 + length > end:
+            continue
+        entries.append((index, start, 4 + length, timestamps[index]))
+    return entries
+
+
+def select_dropped(path: pathlib.Path, rules: PruneRules) -> Tuple[Set[int], int]:
+    region_x, region_z = (int(value) for value in REGION_FILENAME.match(path.name).groups())
+    dropped = set()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+            return dropped, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            entries = read_entries(view)
+            for index, start, length, timestamp in entries:
+                chunk_x, chunk_z = region_x * 32 + index % 32, region_z * 32 + index // 32
+                distance = rules.distance(chunk_x, chunk_z)
+                if rules.max_radius is not None and distance > rules.max_radius:
+                    dropped.add(index)
+                elif rules.min_inhabited is not None and (rules.keep_radius is None or distance > rules.keep_radius):
+                    inhabited = inhabited_time(path, view[start:start + length], chunk_x, chunk_z)
+                    if inhabited is not None and inhabited < rules.min_inhabited:
+                        dropped.add(index)
+    return dropped, len(entries)
+
+
+def compact_region(path: pathlib.Path, dropped: Set[int], dry_run: bool) -> Tuple[int, int]:
+    region_x, region_z = (int(value) for value in REGION_FILENAME.match(path.name).groups())
+    before = path.stat().st_size
+    if before < HEADER_SIZE:
+        return before, before
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        kept = [entry for entry in read_entries(view) if entry[0] not in dropped]
+        # Chunks are packed back to back, taking only the sectors their data needs
+        after = HEADER_SIZE + sum(math.ceil(length / SECTOR_SIZE) * SECTOR_SIZE for _, _, length, _ in kept)
+        if not dropped and after >= before:
+            return before, before
+        if dry_run:
+            return before, (after if kept else 0)
+        for index in dropped:
+            external = path.parent / f"c.{region_x * 32 + index % 32}.{region_z * 32 + index // 32}.mcc"
+            if external.exists():
+                external.unlink()
+        if not kept:
+            path.unlink()
+            return before, 0
+        locations = [0] * CHUNKS_PER_REGION
+        timestamps = [0] * CHUNKS_PER_REGION
+        temporary = path.with_name(f".{path.name}.tmp")
+        with open(temporary, "wb") as output:
+            output.write(bytes(HEADER_SIZE))
+            sector = HEADER_SIZE // SECTOR_SIZE
+            for index, start, length, timestamp in kept:
+                sectors = math.ceil(length / SECTOR_SIZE)
+                locations[index] = sector << 8 | sectors
+                timestamps[index] = timestamp
+                output.write(view[start:start + length])
+                output.write(bytes(sectors * SECTOR_SIZE - length))
+                sector += sectors
+            output.seek(0)
+            output.write(HEADER_TABLE.pack(*locations))
+            output.write(HEADER_TABLE.pack(*timestamps))
+            output.flush()
+            os.fsync(output.fileno())
+    os.chmod(temporary, path.stat().st_mode & 0o7777)
+    os.replace(temporary, path)
+    return before, after
+
+
+def prune_region(path: pathlib.Path, rules: PruneRules, dry_run: bool) -> dict:
+    dropped, chunks = select_dropped(path, rules)
+    result = {"path": f"{path}", "chunks": chunks, "dropped": len(dropped), "before": 0, "after": 0}
+    # Entities and points of interest are stored per chunk in files of the same name, they go with the chunk
+    for region in [path] + [path.parent.parent / directory / path.name for directory in COMPANION_DIRS]:
+        if region.exists():
+            before, after = compact_region(region, dropped, dry_run)
+            result["before"] += before
+            result["after"] += after
+    return result
+
+
+def read_spawn(world: pathlib.Path) -> Tuple[int, int]:
+    try:
+        level = NbtReader(gzip.decompress((world / "level.dat").read_bytes())).read_root()
+        return level["Data"]["SpawnX"], level["Data"]["SpawnZ"]
+    except (OSError, KeyError, ValueError, EOFError):
+        return 0, 0
+
+
+def find_regions(world: pathlib.Path) -> List[pathlib.Path]:
+    regions = []
+    for root, dirs, filenames in os.walk(world):
+        if os.path.basename(root) != "region":
+            continue
+        dirs.clear()
+        regions.extend(pathlib.Path(root) / filename for filename in sorted(filenames)
+                       if REGION_FILENAME.match(filename))
+    return regions
+
+
+class WorldPruner:
+    def __init__(self, rules: PruneRules, workers: int = None):
+        self.rules = rules
+        self.workers = workers
+
+    def prune(self, world: pathlib.Path, dry_run: bool = False) -> dict:
+        regions = find_regions(world)
+        summary = {"world": f"{world}", "dry_run": dry_run, "regions": len(regions), "chunks": 0, "dropped": 0,
+                   "before": 0, "after": 0}
+        # Decompressing and scanning chunks is CPU bound, each region file is a task of its own
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for result in executor.map(prune_region, regions, [self.rules] * len(regions),
+                                       [dry_run] * len(regions)):
+                for key in ("chunks", "dropped", "before", "after"):
+                    summary[key] += result[key]
+        summary["reclaimed"] = summary["before"] - summary["after"]
+        return summary
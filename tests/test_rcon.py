@@ -0,0 +1,160 @@
+import pathlib
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "scripts"))
+
+from rcon import (AUTH, AUTH_FAILED, AUTH_RESPONSE, EXEC_COMMAND, RESPONSE_CHUNK, RESPONSE_VALUE, RconClient,
+                  RconPool, encode_packet)
+
+
+PASSWORD = "secret"
+
+
+class FakeRconHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        fake = self.server
+        with fake.lock:
+            fake.connections.append(self.request)
+            fake.accepted += 1
+        authenticated = False
+        buffer = b""
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while len(buffer) >= 4 and len(buffer) >= 4 + struct.unpack_from("<i", buffer)[0]:
+                length = struct.unpack_from("<i", buffer)[0]
+                request_id, packet_type = struct.unpack_from("<ii", buffer, 4)
+                body = buffer[12:4 + length - 2].decode("utf-8")
+                buffer = buffer[4 + length:]
+                if packet_type == AUTH:
+                    authenticated = body == fake.password
+                    self.request.sendall(encode_packet(request_id if authenticated else AUTH_FAILED,
+                                                       AUTH_RESPONSE, ""))
+                elif packet_type == EXEC_COMMAND and not authenticated:
+                    self.request.sendall(encode_packet(AUTH_FAILED, AUTH_RESPONSE, ""))
+                elif packet_type == EXEC_COMMAND:
+                    with fake.lock:
+                        fake.commands.append(body)
+                    self.respond(request_id, fake.responses.get(body, f"ran {body}"))
+                else:
+                    # Like the vanilla server, which answers unknown requests
+                    self.respond(request_id, f"Unknown request {packet_type:x}")
+
+    def respond(self, request_id: int, text: str):
+        chunks = [text[index:index + RESPONSE_CHUNK] for index in range(0, len(text), RESPONSE_CHUNK)] or [""]
+        for chunk in chunks:
+            self.request.sendall(encode_packet(request_id, RESPONSE_VALUE, chunk))
+
+
+class FakeRconServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password: str = PASSWORD):
+        super().__init__(("127.0.0.1", 0), FakeRconHandler)
+        self.password = password
+        self.responses = {}
+        self.commands = []
+        self.connections = []
+        self.accepted = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def drop_connections(self):
+        with self.lock:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    # Closed by the handler already
+                    pass
+            self.connections.clear()
+
+    def stop(self):
+        self.drop_connections()
+        self.shutdown()
+        self.server_close()
+
+
+class RconClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRconServer()
+        self.client = RconClient("127.0.0.1", self.server.port, PASSWORD, timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_runs_commands_one_at_a_time(self):
+        self.assertEqual(self.client.execute(["say hi", "list"]), ["ran say hi", "ran list"])
+        self.assertEqual(self.server.commands, ["say hi", "list"])
+
+    def test_joins_responses_split_into_chunks(self):
+        self.server.responses["long"] = "".join(chr(ord("a") + index % 26) for index in range(9000))
+        self.assertEqual(self.client.execute(["long", "list"]), [self.server.responses["long"], "ran list"])
+
+    def test_response_of_exactly_one_chunk(self):
+        self.server.responses["full"] = "x" * RESPONSE_CHUNK
+        self.assertEqual(self.client.execute(["full", "list"]), ["x" * RESPONSE_CHUNK, "ran list"])
+
+    def test_pipelined_commands_end_with_the_marker(self):
+        self.server.responses["long"] = "y" * (RESPONSE_CHUNK * 2 + 5)
+        responses = self.client.execute(["say hi", "long", "list"], pipeline=True)
+        self.assertEqual(responses, ["ran say hi", self.server.responses["long"], "ran list"])
+        # The marker answer is not taken for a command response, the session stays usable
+        self.assertEqual(self.client.execute(["list"], pipeline=True), ["ran list"])
+        self.assertEqual(self.server.commands, ["say hi", "long", "list", "list"])
+
+    def test_rejected_password_raises_permission_error(self):
+        client = RconClient("127.0.0.1", self.server.port, "wrong", timeout=5)
+        with self.assertRaises(PermissionError):
+            client.execute(["list"])
+        self.assertIsNone(client.connection)
+        self.assertEqual(self.server.commands, [])
+
+
+class RconPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRconServer()
+        self.pool = RconPool(timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_reuses_the_session(self):
+        self.pool.execute("a", self.server.port, PASSWORD, ["one"])
+        self.pool.execute("a", self.server.port, PASSWORD, ["two"])
+        self.assertEqual(self.server.accepted, 1)
+
+    def test_reconnects_once_when_the_pooled_session_died(self):
+        self.pool.execute("a", self.server.port, PASSWORD, ["one"])
+        self.server.drop_connections()
+        self.assertEqual(self.pool.execute("a", self.server.port, PASSWORD, ["two"]), ["ran two"])
+        self.assertEqual(self.server.accepted, 2)
+        self.assertEqual(self.server.commands, ["one", "two"])
+
+    def test_changed_password_opens_a_new_session(self):
+        self.pool.execute("a", self.server.port, PASSWORD, ["one"])
+        self.server.password = "renewed"
+        self.assertEqual(self.pool.execute("a", self.server.port, "renewed", ["two"]), ["ran two"])
+        self.assertEqual(self.server.accepted, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()